@@ -0,0 +1,100 @@
+"""
+Стоимость выбора обработчика callback'а: цепочка фильтров aiogram против CallbackTable.
+
+Для каждого числа обработчиков из --handlers строятся два варианта:
+Router с N обработчиками на F.data.startswith("kN:") и один общий обработчик
+поверх CallbackTable с теми же N префиксами. Через Dispatcher.feed_update
+прогоняются нажатия на последнюю зарегистрированную кнопку (худший случай
+для перебора фильтров). Обработчики ничего не делают — меряется только маршрутизация.
+
+    python -m benchmarks.callback_dispatch --handlers 5 20 50 100 --updates 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiogram import Bot, Dispatcher, F, Router, types
+from aiogram.filters.callback_data import CallbackData
+
+from benchmarks.common import FAKE_TOKEN, percentiles
+from utils.callbacks import CallbackTable
+
+
+def factory(i: int) -> type[CallbackData]:
+    return type(f"K{i}Cb", (CallbackData,), {"__annotations__": {"rid": int}}, prefix=f"k{i}")
+
+
+def linear_dispatcher(count: int) -> Dispatcher:
+    router = Router()
+    for i in range(count):
+        async def handler(callback: types.CallbackQuery, rid=i) -> None:
+            callback.data.split(":")[1]
+
+        router.callback_query.register(handler, F.data.startswith(f"k{i}:"))
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def table_dispatcher(count: int) -> Dispatcher:
+    table = CallbackTable()
+    for i in range(count):
+        @table.on(factory(i))
+        async def handler(callback: types.CallbackQuery, data: CallbackData) -> None:
+            data.rid
+
+    router = Router()
+
+    @router.callback_query()
+    async def on_callback(callback: types.CallbackQuery) -> None:
+        await table.dispatch(callback)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def update(bot: Bot, update_id: int, data: str) -> types.Update:
+    return types.Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": 70_000 + update_id % 100, "is_bot": False, "first_name": "Bench"},
+            "chat_instance": "bench",
+            "data": data,
+        },
+    }, context={"bot": bot})
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list[types.Update]) -> dict:
+    samples = []
+    for u in updates:
+        started = time.perf_counter()
+        await dp.feed_update(bot, u)
+        samples.append(time.perf_counter() - started)
+    return {**percentiles(samples), "per_sec": round(len(samples) / sum(samples), 1)}
+
+
+async def main(counts: list[int], total: int) -> list[dict]:
+    bot = Bot(FAKE_TOKEN)
+    results = []
+    try:
+        for count in counts:
+            updates = [update(bot, i, f"k{count - 1}:{i}") for i in range(total)]
+            results.append({
+                "handlers": count,
+                "filters": await measure(linear_dispatcher(count), bot, updates),
+                "table": await measure(table_dispatcher(count), bot, updates),
+            })
+    finally:
+        await bot.session.close()
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--handlers", type=int, nargs="+", default=[5, 20, 50, 100])
+    ap.add_argument("--updates", type=int, default=5000)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.handlers, args.updates)), indent=2, ensure_ascii=False))
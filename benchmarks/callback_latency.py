@@ -0,0 +1,100 @@
+"""
+Задержка обработчиков во время импорта CSV.
+
+Имитирует поток нажатий (язык пользователя + страница заявок — те же запросы,
+что делает browse:) и меряет их задержку и лаг event loop. БД заранее наполняется
+--rows заявками; затем замер без нагрузки и замер во время импорта ещё --rows строк.
+
+    python -m benchmarks.callback_latency --rows 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import load_bot, percentiles
+
+
+def append_csv(path, start: int, rows: int) -> None:
+    # Даты — за последние 10 дней, чтобы попадать в окно списка заявок (14 дней)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with open(path, "a", encoding="utf-8") as f:
+        for i in range(start, start + rows):
+            created = (now - timedelta(seconds=i * 17 % 864_000)).strftime("%Y-%m-%d %H:%M:%S")
+            f.write(f"shop{i}.com,${10 + i % 4000},comment {i},,@user{i},{created},ru\n")
+
+
+async def click(bot, uid: int) -> float:
+    started = time.perf_counter()
+    await bot.get_lang(uid)
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=14)
+    await bot.db.read(bot.fetch_requests_page, bot.utc_iso(now), bot.utc_iso(cutoff), "1")
+    return time.perf_counter() - started
+
+
+async def drive_clicks(bot, stop: asyncio.Event, interval: float) -> list[float]:
+    samples, uid = [], 0
+    while not stop.is_set():
+        uid += 1
+        samples.append(await click(bot, uid % 100))
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def watch_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> list[float]:
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+    return lags
+
+
+async def phase(bot, duration: float | None, work=None, interval: float = 0.002) -> dict:
+    stop = asyncio.Event()
+    clicks = asyncio.create_task(drive_clicks(bot, stop, interval))
+    lag = asyncio.create_task(watch_loop_lag(stop))
+
+    started = time.perf_counter()
+    if work is not None:
+        await work()
+    else:
+        await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    return {
+        "seconds": round(elapsed, 3),
+        "callback": percentiles(await clicks),
+        "loop_lag": percentiles(await lag),
+    }
+
+
+async def main(rows: int, idle_seconds: float) -> dict:
+    bot = load_bot()
+
+    async def downloaded() -> bool:
+        return True
+
+    bot.scp_download_async = downloaded
+    append_csv(bot.LOCAL_CSV, 0, rows)
+    await bot.import_csv()
+    append_csv(bot.LOCAL_CSV, rows, rows)
+
+    result = {
+        "rows": rows,
+        "idle": await phase(bot, idle_seconds),
+        "during_import": await phase(bot, None, work=bot.import_csv),
+    }
+    bot.db.close()
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=50_000)
+    ap.add_argument("--idle-seconds", type=float, default=3.0)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.rows, args.idle_seconds)), indent=2, ensure_ascii=False))
@@ -0,0 +1,47 @@
+"""Общая подготовка для бенчмарков: изолированный bot.py с временной БД и CSV."""
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Токен нужен только для валидации в aiogram — в Telegram бенчмарки не ходят
+FAKE_TOKEN = "123456789:AAEbenchmarkbenchmarkbenchmarkbench"
+
+
+def load_bot(workdir: Path | None = None):
+    """
+    Импортирует bot.py так, чтобы он не трогал боевые файлы:
+    .env не читается, БД, CSV и bot_logs.log лежат во временной папке.
+    """
+    workdir = workdir or Path(tempfile.mkdtemp(prefix="giftbot-bench-"))
+    os.environ["TELEGRAM_BOT_API_TOKEN"] = FAKE_TOKEN
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT))
+
+    import dotenv
+    dotenv.load_dotenv = lambda *args, **kwargs: False
+
+    import bot
+
+    bot.DB_PATH = workdir / "requests.db"
+    bot.LOCAL_CSV = workdir / "remote_orders.csv"
+    # Подключения открываются лениво, так что достаточно подменить путь —
+    # db, на который ссылаются outbox, tracked_messages и т.п., остаётся тем же
+    bot.db.path = bot.DB_PATH
+    bot.init_db()
+    return bot
+
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p99/max в миллисекундах."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
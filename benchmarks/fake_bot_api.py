@@ -0,0 +1,158 @@
+"""
+Локальный поддельный Telegram Bot API для бенчмарков.
+
+Отвечает на методы, которыми пользуется бот, считает вызовы по методам и,
+как настоящий Telegram, отвечает 429 с retry_after при превышении лимитов
+на отправку (общего на бота и на один чат).
+"""
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from itertools import islice
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiohttp import web
+
+from benchmarks.common import FAKE_TOKEN
+
+# Методы, на которые распространяются лимиты отправки
+LIMITED = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+
+class FakeBotAPI:
+    def __init__(self, global_rate: int = 30, per_chat_interval: float = 1.0, latency: float = 0.0):
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.latency = latency
+
+        self.calls: Counter[str] = Counter()
+        self.rejected = 0
+        self.delivered: list[tuple[int, str]] = []
+        # Последний показанный экран в чате: (message_id, text, reply_markup)
+        self.screens: dict[int, tuple[int, str, dict | None]] = {}
+
+        # Обновления для getUpdates (режим long polling)
+        self.updates: deque[dict] = deque()
+        self._new_updates = asyncio.Event()
+
+        self._sent: deque[float] = deque()
+        self._chat_last: dict[int, float] = {}
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def make_bot(self) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+        return Bot(token=FAKE_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+    def push_updates(self, updates: list[dict]) -> None:
+        self.updates.extend(updates)
+        self._new_updates.set()
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.screens.clear()
+        self.rejected = 0
+        self.delivered.clear()
+        # Окна лимитов тоже: иначе следующий замер получит 429 за отправки предыдущего
+        self._sent.clear()
+        self._chat_last.clear()
+
+    async def _long_poll(self, data: dict) -> None:
+        """Как настоящий getUpdates: подтверждённые выкидываем, пустой ответ ждём до timeout."""
+        offset = int(data.get("offset", 0) or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if self.updates:
+            return
+        self._new_updates.clear()
+        try:
+            await asyncio.wait_for(self._new_updates.wait(), float(data.get("timeout", 0) or 0))
+        except asyncio.TimeoutError:
+            pass
+
+    def _throttled(self, chat_id: int) -> float:
+        """Сколько ждать клиенту, или 0, если отправка укладывается в лимиты."""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= 1.0:
+            self._sent.popleft()
+        if len(self._sent) >= self.global_rate:
+            return 1.0
+        last = self._chat_last.get(chat_id)
+        if last is not None and now - last < self.per_chat_interval:
+            return self.per_chat_interval
+        self._sent.append(now)
+        self._chat_last[chat_id] = now
+        return 0.0
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            await self._long_poll(data)
+
+        chat_id = int(data.get("chat_id", 0) or 0)
+        if method in LIMITED:
+            retry_after = self._throttled(chat_id)
+            if retry_after:
+                self.rejected += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {int(retry_after)}",
+                        "parameters": {"retry_after": max(1, int(retry_after))},
+                    },
+                    status=429,
+                )
+
+        return web.json_response({"ok": True, "result": self._result(method, data, chat_id)})
+
+    def _result(self, method: str, data: dict, chat_id: int):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "getUpdates":
+            return list(islice(self.updates, int(data.get("limit", 100) or 100)))
+        if method in {"sendMessage", "editMessageText", "editMessageReplyMarkup"}:
+            if method == "sendMessage":
+                self._message_id += 1
+                message_id = self._message_id
+                self.delivered.append((chat_id, data.get("text", "")))
+            else:
+                message_id = int(data.get("message_id", 0) or 0)
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+            if data.get("reply_markup"):
+                message["reply_markup"] = json.loads(data["reply_markup"])
+            self.screens[chat_id] = (message_id, message["text"], message.get("reply_markup"))
+            return message
+        return True
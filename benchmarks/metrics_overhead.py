@@ -0,0 +1,142 @@
+"""
+Цена инструментирования (utils/metrics.py).
+
+1. Сами примитивы: наносекунды на Histogram.observe и Counter.inc.
+2. Бот целиком: --updates нажатий (browse:1 и view:<id>:1 вперемешку) по
+   одному прогоняются через настоящий Dispatcher в поддельный Bot API —
+   с метриками обработчиков, БД и Bot API и без них. Раунды чередуются
+   (--rounds), чтобы шум машины делился поровну.
+
+    python -m benchmarks.metrics_overhead --updates 2000 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiogram import types
+
+from benchmarks.callback_latency import append_csv
+from benchmarks.common import load_bot, percentiles
+from benchmarks.fake_bot_api import FakeBotAPI
+from utils.metrics import ApiMetrics, Counter, Histogram, observe_db
+
+
+def primitives(n: int = 200_000) -> dict:
+    hist = Histogram("bench_seconds", "bench", ("handler",))
+    counter = Counter("bench_total", "bench", ("handler", "error"))
+
+    started = time.perf_counter()
+    for i in range(n):
+        hist.observe(0.003, "cb_view")
+    observe_ns = (time.perf_counter() - started) / n * 1e9
+
+    started = time.perf_counter()
+    for i in range(n):
+        counter.inc("cb_view", "TelegramBadRequest")
+    inc_ns = (time.perf_counter() - started) / n * 1e9
+    return {"observe_ns": round(observe_ns), "inc_ns": round(inc_ns)}
+
+
+def updates(tg_bot, rids: list[int], count: int, first_id: int) -> list[types.Update]:
+    now = int(time.time())
+    result = []
+    for i in range(count):
+        uid = 80_000 + i % 50
+        data = "browse:1" if i % 2 else f"view:{rids[i % len(rids)]}:1"
+        result.append(types.Update.model_validate({
+            "update_id": first_id + i,
+            "callback_query": {
+                "id": str(first_id + i),
+                "from": {"id": uid, "is_bot": False, "first_name": "Bench"},
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": 1,
+                    "date": now,
+                    "chat": {"id": uid, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                    "text": "✨ Главное меню:",
+                },
+            },
+        }, context={"bot": tg_bot}))
+    return result
+
+
+def instrument(botmod, tg_bot, api_metrics: ApiMetrics, on: bool) -> None:
+    observers = (botmod.router.message.middleware, botmod.router.callback_query.middleware)
+    for manager in observers:
+        if botmod.handler_metrics in manager:
+            manager.unregister(botmod.handler_metrics)
+        if on:
+            manager.register(botmod.handler_metrics)
+    if api_metrics in tg_bot.session.middleware:
+        tg_bot.session.middleware.unregister(api_metrics)
+    if on:
+        tg_bot.session.middleware.register(api_metrics)
+    botmod.db.observe = observe_db if on else None
+
+
+async def measure(botmod, tg_bot, batch: list[types.Update]) -> tuple[float, list[float]]:
+    samples = []
+    started = time.perf_counter()
+    for u in batch:
+        t = time.perf_counter()
+        await botmod.dp.feed_update(tg_bot, u)
+        samples.append(time.perf_counter() - t)
+    return time.perf_counter() - started, samples
+
+
+async def main(count: int, rounds: int) -> dict:
+    botmod = load_bot()
+
+    async def downloaded() -> bool:
+        return True
+
+    botmod.scp_download_async = downloaded
+    append_csv(botmod.LOCAL_CSV, 0, 500)
+    await botmod.import_csv()
+    rids = [rid for (rid,) in await botmod.db.fetchall("SELECT id FROM requests LIMIT 100")]
+
+    api = FakeBotAPI(global_rate=1_000_000, per_chat_interval=0)
+    await api.start()
+    tg_bot = api.make_bot()
+    botmod.bot = tg_bot
+    api_metrics = ApiMetrics()
+
+    totals = {"off": 0.0, "on": 0.0}
+    samples: dict[str, list[float]] = {"off": [], "on": []}
+    try:
+        # Прогрев: кэши страниц, языков, подключения
+        instrument(botmod, tg_bot, api_metrics, False)
+        await measure(botmod, tg_bot, updates(tg_bot, rids, 200, 1))
+        first_id = 1000
+        for _ in range(rounds):
+            for mode in ("off", "on"):
+                instrument(botmod, tg_bot, api_metrics, mode == "on")
+                elapsed, batch = await measure(botmod, tg_bot, updates(tg_bot, rids, count, first_id))
+                first_id += count
+                totals[mode] += elapsed
+                samples[mode].extend(batch)
+    finally:
+        await botmod.dp.storage.close()
+        await tg_bot.session.close()
+        await api.stop()
+        botmod.db.close()
+
+    handled = count * rounds
+    return {
+        "primitives": primitives(),
+        "updates": handled,
+        "off": {**percentiles(samples["off"]), "per_sec": round(handled / totals["off"], 1)},
+        "on": {**percentiles(samples["on"]), "per_sec": round(handled / totals["on"], 1)},
+        "overhead_pct": round((totals["on"] / totals["off"] - 1) * 100, 2),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--updates", type=int, default=2000)
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.updates, args.rounds)), indent=2, ensure_ascii=False))
@@ -0,0 +1,130 @@
+"""
+Сколько вызовов Bot API уходит на типичную навигацию.
+
+Прогоняет настоящие обработчики через поддельный Bot API: главное меню →
+список заявок → карточка → назад → следующая страница → главное меню.
+Режим "send" — как раньше: каждый экран новым сообщением с удалением старых;
+режим "edit" — экран правится на месте (render_screen с edit_message).
+Печатает вызовы по методам на один проход и задержку нажатия при --latency.
+
+    python -m benchmarks.navigation_calls --users 20 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from aiogram import types
+
+from benchmarks.callback_latency import append_csv
+from benchmarks.common import load_bot, percentiles
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+def button(markup: dict | None, prefix: str, index: int = 0) -> str:
+    found = [
+        b["callback_data"]
+        for row in (markup or {}).get("inline_keyboard", [])
+        for b in row
+        if b.get("callback_data", "").startswith(prefix)
+    ]
+    return found[index]
+
+
+def callback(api: FakeBotAPI, tg_bot, uid: int, data: str) -> types.CallbackQuery:
+    message_id, text, _ = api.screens[uid]
+    message = types.Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=types.Chat(id=uid, type="private"),
+        text=text,
+    ).as_(tg_bot)
+    return types.CallbackQuery(
+        id=f"{uid}-{message_id}",
+        from_user=types.User(id=uid, is_bot=False, first_name="Bench"),
+        chat_instance="bench",
+        message=message,
+        data=data,
+    ).as_(tg_bot)
+
+
+async def flow(botmod, api: FakeBotAPI, tg_bot, uid: int) -> list[float]:
+    """Один проход навигации; возвращает задержку каждого нажатия."""
+    await botmod.show_main_menu(uid, uid)
+
+    steps = [
+        lambda m: "browse:1",
+        lambda m: button(m, "view:"),
+        lambda m: button(m, "browse:"),
+        lambda m: button(m, "browse:", -1),
+        lambda m: "to_main_menu",
+    ]
+    samples = []
+    for pick in steps:
+        data = pick(api.screens[uid][2])
+        started = time.perf_counter()
+        await botmod.callbacks.dispatch(callback(api, tg_bot, uid, data))
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def run(botmod, api: FakeBotAPI, tg_bot, users: int, mode: str, first_uid: int) -> dict:
+    render = botmod.render_screen
+
+    async def send_only(chat_id, user_id, text, reply_markup=None, edit_message=None):
+        await render(chat_id, user_id, text, reply_markup)
+
+    botmod.render_screen = send_only if mode == "send" else render
+    api.reset()
+    samples = []
+    try:
+        for uid in range(1, users + 1):
+            samples += await flow(botmod, api, tg_bot, first_uid + uid)
+        await botmod.cleaner.drain()
+    finally:
+        botmod.render_screen = render
+
+    calls = Counter({method: count / users for method, count in api.calls.items()})
+    return {
+        "calls_per_flow": dict(calls),
+        "total_per_flow": round(sum(calls.values()), 2),
+        "click": percentiles(samples),
+    }
+
+
+async def main(users: int, latency: float) -> dict:
+    botmod = load_bot()
+
+    async def downloaded() -> bool:
+        return True
+
+    botmod.scp_download_async = downloaded
+    append_csv(botmod.LOCAL_CSV, 0, 200)
+    await botmod.import_csv()
+
+    api = FakeBotAPI(global_rate=1_000_000, per_chat_interval=0, latency=latency)
+    await api.start()
+    tg_bot = api.make_bot()
+    botmod.bot = tg_bot
+    try:
+        result = {
+            "users": users,
+            "latency_ms": latency * 1000,
+            "send": await run(botmod, api, tg_bot, users, "send", first_uid=100_000),
+            "edit": await run(botmod, api, tg_bot, users, "edit", first_uid=200_000),
+        }
+    finally:
+        await tg_bot.session.close()
+        await api.stop()
+        botmod.db.close()
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.0, help="задержка ответа API, с")
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.users, args.latency)), indent=2, ensure_ascii=False))
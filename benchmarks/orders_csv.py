@@ -0,0 +1,145 @@
+"""
+Генератор синтетического orders.csv для бенчмарков импорта.
+
+Столбцы — как ждёт import_csv (CSV_FIELDNAMES в bot.py), без строки заголовка,
+как в выгрузке с сервера. Данные «грязные», как в жизни: ссылки и голые названия
+магазинов, суммы в разных записях ($100, 100€, 2x50, «1 000», мусор), даты
+в нескольких форматах, кавычки и запятые в тексте, доля спама (--spam) и
+повторов уже выданных строк (--duplicates). Одинаковые --seed и --now дают
+побайтно одинаковый файл.
+
+    python -m benchmarks.orders_csv orders.csv --rows 1000000 --seed 1
+"""
+import argparse
+import csv
+import random
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Тот же порядок, что CSV_FIELDNAMES в bot.py (suite сверяет при запуске)
+COLUMNS = [
+    "Магазин",
+    "Номиналы и сумма",
+    "Комментарий",
+    "Доп. инфо",
+    "Телеграм",
+    "Дата и время",
+    "Язык",
+]
+
+BRANDS = [
+    "amazon", "ebay", "walmart", "target", "bestbuy", "apple", "steam", "nike",
+    "adidas", "zalando", "ozon", "wildberries", "sephora", "ikea", "costco", "macys",
+]
+DOMAINS = [".com", ".de", ".co.uk", ".fr", ".ru", ".store"]
+NOTES = [
+    "срочно", "до пятницы", "можно частями", "оплата сразу", "карта US", "-",
+    "нужен чек", "ok", "нужно сегодня", "любой номинал",
+]
+SPAM_SHOPS = ["test", "asd", "qwe", "aaa", "!!!", "proverka123", "a"]
+SPAM_AMOUNTS = ["1", "0", "00000", "99999", "abc", "", "5$"]
+SPAM_NOTES = ["", "a", "asd", "test", "121212", "777777"]
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%d.%m.%Y %H:%M", "%Y-%m-%dT%H:%M:%SZ", "%m/%d/%Y %I:%M %p"]
+# Окно списка заявок — 14 дней; даты кладём в последние 10
+DATE_SPREAD = timedelta(days=10)
+
+
+def shop(rng: random.Random, i: int) -> str:
+    # Много разных магазинов: иначе почти всё схлопнется дедупликацией
+    name = f"{rng.choice(BRANDS)}{i % 5000 or ''}"
+    kind = rng.random()
+    if kind < 0.4:
+        return f"https://www.{name}{rng.choice(DOMAINS)}/gift-cards?ref={i}"
+    if kind < 0.7:
+        return f"{name}{rng.choice(DOMAINS)}"
+    if kind < 0.9:
+        return name.capitalize()
+    return f"  http://{name}{rng.choice(DOMAINS)}  "
+
+
+def amount(rng: random.Random) -> str:
+    value = rng.randint(10, 4000)
+    return rng.choice([
+        f"${value}", f"{value}$", f"€{value}", f"{value}€", f"$ {value}", f"{value}.00",
+        f"{rng.randint(2, 9)}x{value // 10 or 10}", f"{rng.randint(2, 9)}*{value // 10 or 10}",
+        f"{value // 1000} {value % 1000:03d}" if value >= 1000 else f"{value} $",
+        f"номинал {value}",
+    ])
+
+
+def note(rng: random.Random, i: int) -> str:
+    kind = rng.random()
+    if kind < 0.15:
+        return f"almost {rng.randint(10, 500)}"
+    if kind < 0.3:
+        return f"{rng.randint(2, 9)}x{rng.randint(10, 200)}"
+    if kind < 0.4:
+        return f"${rng.randint(10, 500)}"
+    return f"{rng.choice(NOTES)}, заказ №{i}"
+
+
+def created(rng: random.Random, now: datetime) -> str:
+    if rng.random() < 0.005:
+        return rng.choice(["вчера", "", "31.02.2025 25:61"])
+    moment = now - timedelta(seconds=rng.randrange(int(DATE_SPREAD.total_seconds())))
+    return moment.strftime(rng.choice(DATE_FORMATS))
+
+
+def order(rng: random.Random, i: int, now: datetime, spam: bool) -> list[str]:
+    if spam:
+        return [
+            rng.choice(SPAM_SHOPS), rng.choice(SPAM_AMOUNTS), rng.choice(SPAM_NOTES),
+            "", "", created(rng, now), "ru",
+        ]
+    return [
+        shop(rng, i),
+        amount(rng),
+        note(rng, i),
+        rng.choice(["", "", "чек нужен", 'карта "Gold", без PIN']),
+        f"@user{rng.randint(1, 50_000)}",
+        created(rng, now),
+        rng.choice(["ru", "ru", "en"]),
+    ]
+
+
+def generate(
+    path: Path,
+    rows: int,
+    seed: int = 1,
+    spam: float = 0.1,
+    duplicates: float = 0.05,
+    now: datetime | None = None,
+    append: bool = False,
+) -> dict:
+    """Пишет rows строк в path; возвращает, сколько вышло спама и повторов."""
+    rng = random.Random(seed)
+    now = (now or datetime.now(timezone.utc)).replace(microsecond=0, tzinfo=None)
+    recent: deque[list[str]] = deque(maxlen=1000)
+    counts = {"rows": rows, "spam": 0, "duplicates": 0}
+
+    with open(path, "a" if append else "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        for i in range(rows):
+            if recent and rng.random() < duplicates:
+                row = rng.choice(recent)
+                counts["duplicates"] += 1
+            else:
+                is_spam = rng.random() < spam
+                row = order(rng, i, now, is_spam)
+                counts["spam"] += is_spam
+                recent.append(row)
+            writer.writerow(row)
+    return counts
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("path", type=Path)
+    ap.add_argument("--rows", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--spam", type=float, default=0.1, help="доля спам-строк")
+    ap.add_argument("--duplicates", type=float, default=0.05, help="доля повторов")
+    ap.add_argument("--now", type=datetime.fromisoformat, default=None, help="от какого момента отсчитывать даты")
+    args = ap.parse_args()
+    print(generate(args.path, args.rows, args.seed, args.spam, args.duplicates, args.now))
@@ -0,0 +1,86 @@
+"""
+Доставка пачки напоминаний при лимитах Telegram.
+
+Шлёт --messages сообщений в --chats чатов разом через поддельный Bot API
+с лимитами: сначала «как раньше» (все send_message одновременно, ошибки
+теряются), затем через utils.outbox.Outbox. Печатает доставлено/потеряно,
+число ответов 429 и пропускную способность.
+
+    python -m benchmarks.outbox_throughput --messages 300 --chats 150
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import load_bot
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+async def naive(bot, api: FakeBotAPI, messages: list[tuple[int, str]]) -> dict:
+    api.reset()
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(bot.send_message(chat_id, text) for chat_id, text in messages), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    lost = sum(isinstance(r, Exception) for r in results)
+    return {
+        "delivered": len(api.delivered),
+        "lost": lost,
+        "rejected_429": api.rejected,
+        "seconds": round(elapsed, 3),
+    }
+
+
+async def queued(botmod, bot, api: FakeBotAPI, messages: list[tuple[int, str]]) -> dict:
+    api.reset()
+    outbox = botmod.Outbox(bot, botmod.db)
+    await outbox.start()
+
+    started = time.perf_counter()
+    for chat_id, text in messages:
+        await outbox.send(chat_id, text)
+    await outbox.join()
+    elapsed = time.perf_counter() - started
+    await outbox.stop()
+
+    left = (await botmod.db.fetchone("SELECT COUNT(*) FROM outbox"))[0]
+    return {
+        "delivered": len(api.delivered),
+        "lost": len(messages) - len(api.delivered) - left,
+        "left_in_outbox": left,
+        "rejected_429": api.rejected,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(len(api.delivered) / elapsed, 1) if elapsed else None,
+        "outbox_stats": outbox.stats,
+    }
+
+
+async def main(count: int, chats: int) -> dict:
+    botmod = load_bot()
+    api = FakeBotAPI()
+    await api.start()
+    bot = api.make_bot()
+
+    messages = [(10_000 + i % chats, f"🔔 Reminder #{i}") for i in range(count)]
+    try:
+        result = {
+            "messages": count,
+            "chats": chats,
+            "naive": await naive(bot, api, messages),
+            "outbox": await queued(botmod, bot, api, messages),
+        }
+    finally:
+        await bot.session.close()
+        await api.stop()
+        botmod.db.close()
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--messages", type=int, default=300)
+    ap.add_argument("--chats", type=int, default=150)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.messages, args.chats)), indent=2, ensure_ascii=False))
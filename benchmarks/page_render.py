@@ -0,0 +1,69 @@
+"""
+Стоимость показа страницы заявок с кэшем страниц и без него.
+
+Много пользователей листают одни и те же страницы: show_requests вызывается
+для --users пользователей по --pages страниц, отправка в Telegram заглушена.
+"cold" — кэш сбрасывается перед каждым показом, "cached" — обычная работа.
+
+    python -m benchmarks.page_render --users 200 --pages 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.callback_latency import append_csv
+from benchmarks.common import load_bot, percentiles
+
+
+async def run(bot, users: int, tokens: list[str], cold: bool) -> dict:
+    samples = []
+    for uid in range(users):
+        for token in tokens:
+            if cold:
+                bot.invalidate_pages()
+            started = time.perf_counter()
+            await bot.show_requests(uid, uid, token)
+            samples.append(time.perf_counter() - started)
+    return {"render": percentiles(samples), "cache": bot.page_cache.stats()}
+
+
+async def main(users: int, pages: int, rows: int) -> dict:
+    bot = load_bot()
+
+    async def downloaded() -> bool:
+        return True
+
+    async def shown(*args, **kwargs):
+        shown.last = args
+
+    bot.scp_download_async = downloaded
+    bot.render_screen = shown
+    append_csv(bot.LOCAL_CSV, 0, rows)
+    await bot.import_csv()
+
+    # Курсоры страниц — как у кнопки «Вперёд →»
+    tokens = ["1"]
+    for _ in range(pages - 1):
+        await bot.show_requests(0, 0, tokens[-1])
+        markup = shown.last[3]
+        nxt = [b.callback_data for row in markup.inline_keyboard for b in row if b.callback_data.startswith("browse:")]
+        tokens.append(nxt[-1].split(":", 1)[1])
+
+    result = {
+        "users": users,
+        "pages": tokens,
+        "cold": await run(bot, users, tokens, cold=True),
+        "cached": await run(bot, users, tokens, cold=False),
+    }
+    bot.db.close()
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--pages", type=int, default=5)
+    ap.add_argument("--rows", type=int, default=5000)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(main(args.users, args.pages, args.rows)), indent=2, ensure_ascii=False))
@@ -0,0 +1,115 @@
+"""
+Проверка синхронизации CSV (utils/remote.py) против локального SFTP-сервера asyncssh.
+
+Поднимает сервер на 127.0.0.1 с временными ключами и папкой, подключается
+настоящим RemoteConnection и прогоняет сценарии: первая загрузка, файл не менялся,
+дописан хвост, переписан той же длины в ту же секунду (mtime совпадает),
+обрезан, переписано начало. После каждого шага локальная копия должна побайтно
+совпадать с серверной, а статус — с ожидаемым. Печатает время каждого шага.
+
+    python -m benchmarks.remote_sync_check --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import asyncssh
+
+from utils.remote import RemoteConnection
+
+
+async def start_server(root: Path, workdir: Path) -> tuple[asyncssh.SSHAcceptor, Path]:
+    """SFTP-сервер с chroot в root; возвращает (сервер, путь к клиентскому ключу)."""
+    host_key = asyncssh.generate_private_key("ssh-ed25519")
+    client_key = asyncssh.generate_private_key("ssh-ed25519")
+    key_path = workdir / "id_ed25519"
+    client_key.write_private_key(key_path)
+
+    server = await asyncssh.listen(
+        "127.0.0.1",
+        0,
+        server_host_keys=[host_key],
+        authorized_client_keys=asyncssh.import_authorized_keys(
+            client_key.export_public_key().decode()
+        ),
+        sftp_factory=lambda chan: asyncssh.SFTPServer(chan, chroot=str(root).encode()),
+    )
+    return server, key_path
+
+
+def rows(start: int, count: int) -> bytes:
+    return "".join(
+        f"shop{i}.com,${10 + i % 4000},comment {i},,@user{i},2026-10-01 12:00:00,ru\n"
+        for i in range(start, start + count)
+    ).encode()
+
+
+def rewrite(path: Path, data: bytes, keep_mtime: bool = False) -> None:
+    mtime = path.stat().st_mtime if keep_mtime else None
+    path.write_bytes(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+async def main(count: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="giftbot-sftp-") as tmp:
+        tmp = Path(tmp)
+        root = tmp / "remote"
+        root.mkdir()
+        remote_csv = root / "orders.csv"
+        local_csv = tmp / "local.csv"
+
+        server, key_path = await start_server(root, tmp)
+        port = server.sockets[0].getsockname()[1]
+        remote = RemoteConnection("127.0.0.1", "bench", str(key_path), port=port, attempts=1)
+
+        base = rows(0, count)
+        same_size = base.replace(b"comment", b"commenT", 1)
+        appended = same_size + rows(count, 100)
+        # Та же длина, отличается только последняя строка
+        tail_changed = appended[:-3] + b"en\n"
+        steps = [
+            ("first download", lambda: rewrite(remote_csv, base), "full"),
+            ("nothing changed", lambda: None, "unchanged"),
+            ("tail appended", lambda: rewrite(remote_csv, base + rows(count, 100)), "appended"),
+            ("same size and mtime, head rewritten",
+             lambda: rewrite(remote_csv, appended, keep_mtime=True), "full"),
+            ("same size and mtime, tail rewritten",
+             lambda: rewrite(remote_csv, tail_changed, keep_mtime=True), "full"),
+            ("truncated", lambda: rewrite(remote_csv, base[: len(base) // 2]), "full"),
+        ]
+
+        results = []
+        try:
+            for name, change, expected in steps:
+                change()
+                started = time.perf_counter()
+                status = await remote.sync("/orders.csv", local_csv)
+                results.append({
+                    "step": name,
+                    "status": status,
+                    "expected": expected,
+                    "seconds": round(time.perf_counter() - started, 4),
+                    "identical": local_csv.read_bytes() == remote_csv.read_bytes(),
+                })
+        finally:
+            await remote.close()
+            server.close()
+            await server.wait_closed()
+
+    ok = all(r["status"] == r["expected"] and r["identical"] for r in results)
+    return {"rows": count, "steps": results, "connects": remote.stats["connects"], "ok": ok}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=20_000)
+    args = ap.parse_args()
+    result = asyncio.run(main(args.rows))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["ok"] else 1)
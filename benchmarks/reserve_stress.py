@@ -0,0 +1,86 @@
+"""
+Нагрузочная проверка брони: сотни одновременных reserve: на одну заявку.
+
+Прогоняет через таблицу callback'ов настоящий обработчик cb_reserve с поддельными CallbackQuery
+(отправка в Telegram и планировщик заглушены) и проверяет, что победитель
+ровно один и именно он записан в БД.
+
+    python -m benchmarks.reserve_stress --clicks 500 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import load_bot
+
+
+def fake_callback(data: str, uid: int, replies: list):
+    async def answer(text=None, show_alert=False):
+        replies.append((uid, text))
+
+    async def noop(*args, **kwargs):
+        return None
+
+    return SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=uid),
+        message=SimpleNamespace(chat=SimpleNamespace(id=uid), edit_reply_markup=noop),
+        answer=answer,
+    )
+
+
+async def round_(bot, rid: int, clicks: int, first_uid: int) -> dict:
+    replies: list = []
+    callbacks = [fake_callback(f"reserve:{rid}:1", first_uid + i, replies) for i in range(clicks)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bot.callbacks.dispatch(cb) for cb in callbacks))
+    elapsed = time.perf_counter() - started
+
+    winners = [uid for uid, text in replies if text and text.startswith("✅")]
+    owner = (await bot.db.fetchone("SELECT reserved_by FROM requests WHERE id=?", (rid,)))[0]
+    return {
+        "clicks": clicks,
+        "seconds": round(elapsed, 3),
+        "winners": len(winners),
+        "owner_matches": winners == [owner],
+    }
+
+
+async def main(clicks: int, rounds: int) -> dict:
+    bot = load_bot()
+
+    async def noop(*args, **kwargs):
+        return None
+
+    bot.show_requests = noop
+    bot.show_my_requests = noop
+    bot.schedule_release = noop
+    bot.schedule_reminder = noop
+
+    rid = await bot.db.run(lambda con: con.execute(
+        "INSERT INTO requests (shop_link, amount, note, created_at) VALUES ('Amazon', '$100', '-', ?)",
+        (bot.utc_iso(bot.datetime.now(bot.timezone.utc)),)
+    ).lastrowid)
+
+    results = []
+    for n in range(rounds):
+        results.append(await round_(bot, rid, clicks, first_uid=1_000_000 * (n + 1)))
+        # Освобождаем заявку перед следующим раундом
+        await bot.db.execute("UPDATE requests SET reserved_by=NULL, reserved_until=NULL WHERE id=?", (rid,))
+
+    bot.db.close()
+    return {"rounds": results, "ok": all(r["winners"] == 1 and r["owner_matches"] for r in results)}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--clicks", type=int, default=500)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+    result = asyncio.run(main(args.clicks, args.rounds))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["ok"] else 1)
@@ -0,0 +1,315 @@
+"""
+Воспроизводимый набор бенчмарков: импорт CSV и сценарии нажатий в поддельный Bot API.
+
+Каждый замер идёт в отдельном процессе с чистой временной папкой — пиковая
+память (peak_rss_mb) честно относится к нему одному.
+
+- import: orders.csv на --sizes строк (benchmarks/orders_csv.py, одинаковый --seed
+  даёт одинаковые файлы), затем import_csv целиком — время, строк в секунду,
+  этапы из utils/metrics.py, итоги по строкам и повторный импорт без новых строк.
+- flows: БД на --flow-rows заявок, --users пользователей одновременно проходят
+  /start → browse: → view: → reserve: → my_requests через настоящий Dispatcher;
+  задержка каждого шага (p50/p99), пропускная способность, вызовы Bot API.
+
+Результаты пишутся в JSON (--out); --compare сравнивает два таких файла.
+
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --users 100 --out results.json
+    python -m benchmarks.suite --compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.common import ROOT, load_bot, percentiles
+from benchmarks.orders_csv import COLUMNS, generate
+
+FLOW_STEPS = ("start", "browse", "view", "reserve", "my_requests")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def prepare_bot(workdir: Path):
+    botmod = load_bot(workdir)
+    assert COLUMNS == botmod.CSV_FIELDNAMES, "benchmarks/orders_csv.py: столбцы разошлись с bot.py"
+
+    async def downloaded() -> bool:
+        return True
+
+    botmod.scp_download_async = downloaded
+    return botmod
+
+
+# ──────────── import ────────────
+async def bench_import(workdir: Path, rows: int, seed: int, now: datetime) -> dict:
+    from utils.metrics import IMPORT_ROWS, IMPORT_SECONDS
+
+    botmod = prepare_bot(workdir)
+    started = time.perf_counter()
+    generated = generate(botmod.LOCAL_CSV, rows, seed=seed, now=now)
+    generate_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await botmod.import_csv()
+    elapsed = time.perf_counter() - started
+
+    # Второй проход: водяная метка на конце файла, читать нечего
+    started = time.perf_counter()
+    await botmod.import_csv()
+    noop = time.perf_counter() - started
+
+    stored = (await botmod.db.fetchone("SELECT COUNT(*) FROM requests"))[0]
+    botmod.db.close()
+    return {
+        "rows": rows,
+        "csv_mb": round(botmod.LOCAL_CSV.stat().st_size / 2**20, 1),
+        "generated": generated,
+        "generate_seconds": round(generate_seconds, 3),
+        "import_seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1),
+        # Этапы суммарно за все пачки первого импорта (download — заглушка)
+        "phase_seconds": {
+            phase: round(IMPORT_SECONDS.total(phase), 3) for phase in ("parse", "normalize", "insert")
+        },
+        "result_rows": {
+            result: int(IMPORT_ROWS.value(result)) for result in ("new", "spam", "reserved", "duplicate")
+        },
+        "stored": stored,
+        "noop_import_seconds": round(noop, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ──────────── flows ────────────
+def button(markup: dict | None, prefix: str, pick: int = 0) -> str | None:
+    found = [
+        b["callback_data"]
+        for row in (markup or {}).get("inline_keyboard", [])
+        for b in row
+        if b.get("callback_data", "").startswith(prefix)
+    ]
+    return found[pick % len(found)] if found else None
+
+
+class Client:
+    """Один пользователь: собирает апдейты так, как их прислал бы Telegram."""
+
+    def __init__(self, api, tg_bot, uid: int):
+        self.api = api
+        self.tg_bot = tg_bot
+        self.uid = uid
+        self.update_id = uid * 100
+
+    def _update(self, payload: dict):
+        from aiogram import types
+
+        self.update_id += 1
+        return types.Update.model_validate(
+            {"update_id": self.update_id, **payload}, context={"bot": self.tg_bot}
+        )
+
+    def _user(self) -> dict:
+        return {"id": self.uid, "is_bot": False, "first_name": "Bench"}
+
+    def command(self, text: str):
+        return self._update({"message": {
+            "message_id": self.update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": self.uid, "type": "private"}, "from": self._user(),
+        }})
+
+    def press(self, data: str):
+        message_id, text, _ = self.api.screens[self.uid]
+        return self._update({"callback_query": {
+            "id": f"{self.uid}-{self.update_id}", "chat_instance": "bench", "data": data,
+            "from": self._user(),
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": self.uid, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+            },
+        }})
+
+    @property
+    def markup(self) -> dict | None:
+        return self.api.screens[self.uid][2]
+
+
+async def flow(botmod, client: Client, samples: dict[str, list[float]]) -> None:
+    async def step(name: str, update) -> None:
+        started = time.perf_counter()
+        await botmod.dp.feed_update(client.tg_bot, update)
+        samples[name].append(time.perf_counter() - started)
+
+    await step("start", client.command("/start"))
+    await step("browse", client.press("browse:1"))
+    # Разные пользователи — разные карточки, но совпадения (и отказы в брони) тоже бывают
+    view = button(client.markup, "view:", client.uid)
+    if view is None:
+        return
+    await step("view", client.press(view))
+    reserve = button(client.markup, "reserve:")
+    if reserve is not None:
+        await step("reserve", client.press(reserve))
+    await step("my_requests", client.press("my_requests"))
+
+
+async def bench_flows(workdir: Path, rows: int, users: int, latency: float, seed: int, now: datetime) -> dict:
+    from benchmarks.fake_bot_api import FakeBotAPI
+
+    botmod = prepare_bot(workdir)
+    generate(botmod.LOCAL_CSV, rows, seed=seed, now=now)
+    await botmod.import_csv()
+
+    api = FakeBotAPI(global_rate=1_000_000, per_chat_interval=0, latency=latency)
+    await api.start()
+    tg_bot = api.make_bot()
+    botmod.bot = tg_bot
+
+    samples: dict[str, list[float]] = {name: [] for name in FLOW_STEPS}
+    try:
+        clients = [Client(api, tg_bot, 90_000 + i) for i in range(users)]
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(botmod, c, samples) for c in clients))
+        elapsed = time.perf_counter() - started
+        reserved = (await botmod.db.fetchone(
+            "SELECT COUNT(*) FROM requests WHERE reserved_by IS NOT NULL"
+        ))[0]
+    finally:
+        await botmod.dp.storage.close()
+        await tg_bot.session.close()
+        await api.stop()
+        botmod.db.close()
+
+    handled = sum(len(s) for s in samples.values())
+    return {
+        "rows": rows,
+        "users": users,
+        "latency_ms": latency * 1000,
+        "seconds": round(elapsed, 3),
+        "flows_per_sec": round(users / elapsed, 1),
+        "updates_per_sec": round(handled / elapsed, 1),
+        "steps": {name: percentiles(s) for name, s in samples.items()},
+        "all_steps": percentiles([x for s in samples.values() for x in s]),
+        "reserved": reserved,
+        "api_calls_per_flow": {m: round(n / users, 2) for m, n in sorted(api.calls.items())},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ──────────── запуск и сравнение ────────────
+def child(args: argparse.Namespace) -> dict:
+    """Один замер внутри отдельного процесса."""
+    now = datetime.fromisoformat(args.now)
+    with tempfile.TemporaryDirectory(prefix="giftbot-suite-") as workdir:
+        if args.scenario == "import":
+            return asyncio.run(bench_import(Path(workdir), args.rows, args.seed, now))
+        return asyncio.run(bench_flows(Path(workdir), args.rows, args.users, args.latency, args.seed, now))
+
+
+def spawn(scenario: str, rows: int, args: argparse.Namespace, now: str) -> dict:
+    cmd = [
+        sys.executable, "-m", "benchmarks.suite", "--scenario", scenario,
+        "--rows", str(rows), "--seed", str(args.seed), "--now", now,
+        "--users", str(args.users), "--latency", str(args.latency),
+    ]
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{scenario} rows={rows} упал:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args: argparse.Namespace) -> dict:
+    # Даты в CSV отсчитываются от одного момента для всех замеров
+    now = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    result = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in {"scenario", "compare", "out"}},
+        },
+        "import": {},
+    }
+    for rows in args.sizes:
+        print(f"⏱ import {rows}…", file=sys.stderr)
+        result["import"][str(rows)] = spawn("import", rows, args, now.isoformat())
+    print(f"⏱ flows {args.users} users…", file=sys.stderr)
+    result["flows"] = spawn("flows", args.flow_rows, args, now.isoformat())
+    return result
+
+
+def flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old_path: Path, new_path: Path, threshold: float = 10.0) -> list[str]:
+    """Сравнивает времена, задержки, пропускную способность и память двух прогонов."""
+    old = flatten({k: v for k, v in json.loads(old_path.read_text()).items() if k != "meta"})
+    new = flatten({k: v for k, v in json.loads(new_path.read_text()).items() if k != "meta"})
+    lines = []
+    for key in sorted(old.keys() & new.keys()):
+        higher_is_better = key.endswith("_per_sec")
+        if not (higher_is_better or key.endswith(("seconds", "_ms", "_mb"))) or key.endswith("latency_ms"):
+            continue
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        worse = -change if higher_is_better else change
+        mark = "⚠️" if worse > threshold else "  "
+        lines.append(f"{mark} {key:<45} {old[key]:>12} → {new[key]:<12} {change:+.1f}%")
+    return lines
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    ap.add_argument("--flow-rows", type=int, default=5000, help="заявок в БД для сценария flows")
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", type=Path, default=Path("bench_results.json"))
+    ap.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"))
+    # Внутренние: запуск одного замера в дочернем процессе
+    ap.add_argument("--scenario", choices=["import", "flows"], help=argparse.SUPPRESS)
+    ap.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--now", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.compare:
+        print("\n".join(compare(*args.compare)))
+    elif args.scenario:
+        print(json.dumps(child(args), ensure_ascii=False))
+    else:
+        results = run_suite(args)
+        args.out.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"💾 {args.out}", file=sys.stderr)
@@ -0,0 +1,163 @@
+"""
+Пропускная способность приёма обновлений: вебхук против long polling.
+
+Синтетические нажатия browse:1 от --users пользователей (всего --updates)
+прогоняются через настоящий Dispatcher бота, ответы уходят в поддельный
+Bot API (--latency — его задержка). Вебхук: обновления POST'ятся в
+utils.webhook так же, как это делает Telegram (до --connections запросов
+одновременно); long polling: те же обновления отдаются через getUpdates.
+
+    python -m benchmarks.webhook_throughput --updates 2000 --users 200 --latency 0.01
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.callback_latency import append_csv
+from benchmarks.common import load_bot, percentiles
+from benchmarks.fake_bot_api import FakeBotAPI
+from utils.webhook import ChatOrderedPool, build_webhook_app, chat_key
+
+
+def synthetic_updates(count: int, users: int, first_id: int) -> list[dict]:
+    now = int(time.time())
+    updates = []
+    for i in range(count):
+        uid = 70_000 + i % users
+        updates.append({
+            "update_id": first_id + i,
+            "callback_query": {
+                "id": str(first_id + i),
+                "from": {"id": uid, "is_bot": False, "first_name": "Bench"},
+                "chat_instance": "bench",
+                "data": "browse:1",
+                "message": {
+                    "message_id": 1,
+                    "date": now,
+                    "chat": {"id": uid, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                    "text": "✨ Главное меню:",
+                },
+            },
+        })
+    return updates
+
+
+async def wait_answered(api: FakeBotAPI, count: int) -> None:
+    while api.calls["answerCallbackQuery"] < count:
+        await asyncio.sleep(0.005)
+
+
+async def webhook(botmod, api: FakeBotAPI, tg_bot, updates: list[dict], workers: int, connections: int) -> dict:
+    api.reset()
+    order: dict[int, list[int]] = defaultdict(list)
+
+    async def handle(update):
+        order[chat_key(update)].append(update.update_id)
+        await botmod.dp.feed_update(tg_bot, update)
+
+    pool = ChatOrderedPool(handle, workers=workers)
+    runner = web.AppRunner(build_webhook_app(tg_bot, pool, "/webhook"), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = "http://127.0.0.1:%s/webhook" % site._server.sockets[0].getsockname()[1]
+    await pool.start()
+
+    acks: list[float] = []
+    sem = asyncio.Semaphore(connections)
+
+    async def post(session: aiohttp.ClientSession, update: dict) -> None:
+        async with sem:
+            sent = time.perf_counter()
+            async with session.post(url, json=update) as resp:
+                assert resp.status == 200, resp.status
+            acks.append(time.perf_counter() - sent)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, u) for u in updates))
+    accepted = time.perf_counter() - started
+    await pool.join()
+    await wait_answered(api, len(updates))
+    elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    await pool.stop()
+    return {
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1),
+        "accept_seconds": round(accepted, 3),
+        "ack": percentiles(acks),
+        "per_chat_ordered": all(ids == sorted(ids) for ids in order.values()),
+        "pool": pool.stats,
+    }
+
+
+async def polling(botmod, api: FakeBotAPI, tg_bot, updates: list[dict]) -> dict:
+    api.reset()
+    started = time.perf_counter()
+    api.push_updates(updates)
+    task = asyncio.create_task(
+        botmod.dp.start_polling(tg_bot, polling_timeout=1, handle_signals=False, close_bot_session=False)
+    )
+    await wait_answered(api, len(updates))
+    elapsed = time.perf_counter() - started
+    await botmod.dp.stop_polling()
+    await task
+    # Дать дописаться последним ответам, пока поддельный API ещё работает
+    await asyncio.sleep(0.5)
+    return {
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1),
+        "getUpdates_calls": api.calls["getUpdates"],
+    }
+
+
+async def main(count: int, users: int, latency: float, workers: int, connections: int) -> dict:
+    botmod = load_bot()
+
+    async def downloaded() -> bool:
+        return True
+
+    botmod.scp_download_async = downloaded
+    append_csv(botmod.LOCAL_CSV, 0, 500)
+    await botmod.import_csv()
+
+    api = FakeBotAPI(global_rate=1_000_000, per_chat_interval=0, latency=latency)
+    await api.start()
+    tg_bot = api.make_bot()
+    botmod.bot = tg_bot
+    try:
+        result = {
+            "updates": count,
+            "users": users,
+            "latency_ms": latency * 1000,
+            "webhook": await webhook(botmod, api, tg_bot, synthetic_updates(count, users, 1), workers, connections),
+            "polling": await polling(botmod, api, tg_bot, synthetic_updates(count, users, count + 1)),
+        }
+    finally:
+        await botmod.dp.storage.close()
+        await tg_bot.session.close()
+        await api.stop()
+        botmod.db.close()
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--updates", type=int, default=2000)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.01, help="задержка ответа Bot API, с")
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--connections", type=int, default=40, help="как max_connections у setWebhook")
+    args = ap.parse_args()
+    print(json.dumps(
+        asyncio.run(main(args.updates, args.users, args.latency, args.workers, args.connections)),
+        indent=2, ensure_ascii=False,
+    ))
@@ -2,7 +2,6 @@
 
 import re
 import os
-import csv
 import logging
 import asyncio
 import sqlite3
@@ -10,25 +9,58 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 from dateutil import parser
-from aiogram import F
 from math import ceil
-import asyncssh
-from aiogram import Bot, Dispatcher, Router, types, F
+from itertools import islice
+from aiogram import Bot, Dispatcher, Router, types
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import aiofiles
-from utils import shorten_date
+from utils.remote import RemoteConnection
+from utils.csv_import import CsvTail, Watermark, load_watermark, save_watermark, resume_offset
+from utils.cache import LRUCache, VersionedCache
+from utils.callbacks import (
+    PAGE_TOKEN_RE,
+    BrowseCb,
+    CallbackTable,
+    CancelCb,
+    MyBrowseCb,
+    MyRequestCb,
+    RenewCb,
+    ReserveCb,
+    ViewCb,
+)
+from utils.db import Database
+from utils.display import DISPLAY_COLUMNS, display_columns
+from utils.fsm_storage import SQLiteStorage
+from utils.logs import parse_levels, setup_logging
+from utils.metrics import (
+    IMPORT_ROWS,
+    IMPORT_SECONDS,
+    ApiMetrics,
+    HandlerMetrics,
+    LoopLagMonitor,
+    counted_job,
+    observe_db,
+    start_metrics_server,
+    watch_cache,
+    watch_scheduler,
+)
+from utils.migrations import migrate
+from utils.messages import BackgroundCleaner, MessageTracker
+from utils.outbox import Outbox, store_message
+from utils.sweeper import DeadlineSweeper
+from utils.webhook import run_webhook
 from dotenv import load_dotenv, find_dotenv
 
 
 # ================== SCHEDULER ==================
 scheduler = AsyncIOScheduler(timezone="UTC")
+watch_scheduler(scheduler)
 
 # ================== CONSTANTS & PATHS ==================
 DB_PATH = Path("/root/richi_gift_bot/requests.db")
@@ -42,19 +74,21 @@ REMOTE = {
     "remote_csv": "/root/mk_tg_bot/orders.csv",
 }
 
+# ================== ENV ==================
+load_dotenv(find_dotenv(), override=True)
+
 # ================== LOGGING ==================
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("bot_logs.log"),
-    ],
+# 📝 Логи пишет отдельный поток (utils/logs.py): файл — JSON с ротацией, консоль — текст.
+# С одного места в коде — не больше 20 записей INFO/WARNING за 10 с, остальное считается в suppressed.
+# LOG_LEVELS — уровни отдельных логгеров: "aiogram.event=WARNING,utils.outbox=DEBUG"
+setup_logging(
+    os.getenv("LOG_FILE", "bot_logs.log"),
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    levels={"apscheduler": "WARNING", **parse_levels(os.getenv("LOG_LEVELS", ""))},
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+    backups=int(os.getenv("LOG_BACKUPS", "5")),
 )
 logger = logging.getLogger(__name__)
-
-# ================== ENV ==================
-load_dotenv(find_dotenv(), override=True)
 API_TOKEN: str | None = os.getenv("TELEGRAM_BOT_API_TOKEN")
 
 if not API_TOKEN:
@@ -62,39 +96,65 @@ if not API_TOKEN:
 else:
     logger.info("✅ TOKEN загружен успешно")
 
+# 🌐 BOT_MODE=webhook — получать обновления вебхуком (встроенный aiohttp), иначе long polling
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK = {
+    "url": os.getenv("WEBHOOK_URL", ""),            # публичный https-адрес, который видит Telegram
+    "host": os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+    "port": int(os.getenv("WEBHOOK_PORT", "8080")),
+    "path": os.getenv("WEBHOOK_PATH", "/webhook"),
+    "secret": os.getenv("WEBHOOK_SECRET") or None,
+    "workers": int(os.getenv("WEBHOOK_WORKERS", "16")),
+}
+if BOT_MODE == "webhook" and not WEBHOOK["url"]:
+    # set_webhook("") молча снимет вебхук — бот запустится и не получит ни одного обновления
+    raise RuntimeError("❌ BOT_MODE=webhook, но WEBHOOK_URL не задан")
+# 📈 Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics; METRICS_PORT=0 — не поднимать сервер
+METRICS = {
+    "host": os.getenv("METRICS_HOST", "127.0.0.1"),
+    "port": int(os.getenv("METRICS_PORT", "9108")),
+}
+
 # ================== AIOGRAM CORE ==================
 bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(ApiMetrics())
+# 🗄 БД нужна уже здесь: состояния FSM хранятся в ней (utils/fsm_storage.py)
+db = Database(DB_PATH)
+db.observe = observe_db
+dp = Dispatcher(storage=SQLiteStorage(db))
 router = Router()
 dp.include_router(router)
+# 🔀 Все callback-кнопки идут через одну таблицу префиксов (utils/callbacks.py)
+callbacks = CallbackTable()
+
+
+def handler_label(event: types.TelegramObject, data: dict) -> str:
+    # Все callback'и приходят в один on_callback — метим по обработчику из таблицы
+    if isinstance(event, types.CallbackQuery):
+        return callbacks.name(event.data)
+    return data["handler"].callback.__name__
+
+
+handler_metrics = HandlerMetrics(handler_label)
+router.message.middleware(handler_metrics)
+router.callback_query.middleware(handler_metrics)
 
 # ================== FSM ==================
 class LangFSM(StatesGroup):
     choosing = State()
 
 # ================== DATABASE INIT ==================
+
 def init_db() -> None:
-    print(f"📂 Текущий путь к БД: {DB_PATH}")  # ← вот сюда
-
-    with sqlite3.connect(DB_PATH) as con:
-        con.executescript(
-            '''
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_link TEXT NOT NULL,
-                amount TEXT NOT NULL,
-                note TEXT,
-                reserved_by INTEGER,
-                reserved_until TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                lang TEXT DEFAULT 'ru'
-            );
-            '''
-        )
-        con.commit()
+    logger.info("📂 Текущий путь к БД: %s", DB_PATH)
+
+    # ⚙️ WAL, synchronous=NORMAL, кэш страниц и mmap — см. utils/db.py PRAGMAS
+    con = db.connect()
+    try:
+        version = migrate(con)
+    finally:
+        con.close()
+    logger.info("🗄 Схема БД: версия %s", version)
 
 # ====== АНТИСПАМ: проверка магазина ======
 def is_spammy_shop(text: str) -> bool:
@@ -145,15 +205,12 @@ def is_spammy_amount(amount: str) -> bool:
 
     return False
 # ================== SCP DOWNLOAD ==================
+# 🔌 Одно SSH/SFTP подключение на весь процесс (закрывается в main)
+remote = RemoteConnection(REMOTE["host"], REMOTE["user"], REMOTE["key"])
+
 async def scp_download_async() -> bool:
     try:
-        async with asyncssh.connect(
-            REMOTE["host"],
-            username=REMOTE["user"],
-            client_keys=[REMOTE["key"]],
-            known_hosts=None
-        ) as conn:
-            await asyncssh.scp((conn, REMOTE["remote_csv"]), LOCAL_CSV)
+        await remote.sync(REMOTE["remote_csv"], LOCAL_CSV)
         return True
     except Exception as e:
         logger.error("SCP download failed: %s", e)
@@ -161,16 +218,11 @@ async def scp_download_async() -> bool:
 
 
 # ================== УТИЛИТЫ ==================
-def shorten_date(date_str: str, lang: str = "ru") -> str:
-    try:
-        dt = datetime.fromisoformat(date_str)
-        if lang == "ru":
-            return dt.strftime("%d.%m")
-        else:
-            return dt.strftime("%b %d")  # Jul 04
-    except Exception:
-        return "??.??"
-
+def utc_iso(dt: datetime) -> str:
+    """Единый формат времени в БД: UTC с точностью до секунд, сортируется как строка."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
 
 def normalize_shop_name(raw_shop: str) -> str:
     raw_shop = raw_shop.strip()
@@ -230,11 +282,30 @@ def normalize_amount(raw_amount: str) -> str:
     return ""
 
 # ================== IMPORT CSV ==================
+CSV_FIELDNAMES = [
+    "Магазин",
+    "Номиналы и сумма",
+    "Комментарий",
+    "Доп. инфо",
+    "Телеграм",
+    "Дата и время",
+    "Язык"
+]
+IMPORT_BATCH = 500  # строк на одну транзакцию
+# 🏷 Готовые к показу поля (utils/display.py) считаются здесь, один раз на заявку
+IMPORT_DISPLAY = ", ".join(DISPLAY_COLUMNS)
 
 async def import_csv():
     logger.info("📥 Импорт CSV начинается")
 
-    if not await scp_download_async():
+    with IMPORT_SECONDS.time("total"):
+        await _import_csv()
+
+
+async def _import_csv():
+    with IMPORT_SECONDS.time("download"):
+        downloaded = await scp_download_async()
+    if not downloaded:
         logger.error("❌ Не удалось скачать CSV с удалённого сервера")
         return
 
@@ -242,152 +313,260 @@ async def import_csv():
         logger.error("❌ Локальный CSV файл не найден")
         return
 
-    async with aiofiles.open(LOCAL_CSV, "r", encoding="utf-8") as f:
-        content = await f.read()
-
-    fieldnames = [
-        "Магазин",
-        "Номиналы и сумма",
-        "Комментарий",
-        "Доп. инфо",
-        "Телеграм",
-        "Дата и время",
-        "Язык"
-    ]
+    new_cnt, spam_cnt, reserved_cnt, dup_cnt = await import_csv_rows()
+    for result, count in (("new", new_cnt), ("spam", spam_cnt), ("reserved", reserved_cnt), ("duplicate", dup_cnt)):
+        if count:
+            IMPORT_ROWS.inc(result, amount=count)
+    if new_cnt:
+        invalidate_pages()
+
+    if new_cnt or spam_cnt or reserved_cnt or dup_cnt:
+        logger.info(
+            "✅ Импорт завершён: новых %s, спам %s, забронированных %s, дубликатов %s",
+            new_cnt, spam_cnt, reserved_cnt, dup_cnt
+        )
+    else:
+        logger.info("ℹ️ Новых строк в CSV нет")
+
+
+async def import_csv_rows() -> tuple[int, int, int, int]:
+    """
+    Потоково читает строки CSV после водяной метки и пишет их пачками по IMPORT_BATCH.
+    Разбор идёт в рабочем потоке, запись — короткими транзакциями в потоке БД
+    (метка сохраняется вместе с пачкой), между ними успевают пройти запросы обработчиков.
+    Возвращает (новых, спам, забронированных, дубликатов).
+    """
+    new_cnt = spam_cnt = reserved_cnt = dup_cnt = 0
+    source = str(LOCAL_CSV)
+
+    # 📍 Продолжаем с места прошлого импорта (или с нуля, если файл переписан)
+    watermark = await db.read(load_watermark, source)
+    start = await asyncio.to_thread(resume_offset, LOCAL_CSV, watermark)
+    if start == 0 and watermark.offset:
+        logger.warning("♻️ CSV обрезан или переписан — полный перескан")
+
+    tail = CsvTail(LOCAL_CSV, start, CSV_FIELDNAMES)
+    rows = iter(tail)
+    try:
+        while True:
+            batch, spam, mark = await asyncio.to_thread(next_import_batch, tail, rows)
+            if mark is None:
+                break
+            with IMPORT_SECONDS.time("insert"):
+                inserted, reserved, dups = await db.run(write_import_batch, batch, source, mark)
+
+            new_cnt += inserted
+            spam_cnt += spam
+            reserved_cnt += reserved
+            dup_cnt += dups
+    finally:
+        rows.close()
+
+    return new_cnt, spam_cnt, reserved_cnt, dup_cnt
+
+
+def next_import_batch(tail: CsvTail, rows) -> tuple[list[tuple], int, Watermark | None]:
+    """Следующие IMPORT_BATCH строк: (нормализованная пачка, спам, метка). Метка None — строки кончились."""
+    with IMPORT_SECONDS.time("parse"):
+        chunk = list(islice(rows, IMPORT_BATCH))
+    if not chunk:
+        return [], 0, None
+    with IMPORT_SECONDS.time("normalize"):
+        batch, spam = normalize_rows(chunk)
+    return batch, spam, tail.watermark()
+
+
+def write_import_batch(con: sqlite3.Connection, batch: list[tuple], source: str, mark: Watermark) -> tuple[int, int, int]:
+    counts = bulk_insert_requests(con, batch)
+    save_watermark(con, source, mark)
+    return counts
+
+
+def normalize_rows(rows: list[dict]) -> tuple[list[tuple], int]:
+    """Нормализует строки CSV и отсеивает спам. Возвращает (пачка для вставки, сколько спама)."""
+    batch = []
+    spam_cnt = 0
+
+    for row in rows:
+        try:
+            raw_shop = row["Магазин"].strip()
+            raw_amount = row["Номиналы и сумма"].strip()
+            raw_note = (row.get("Комментарий") or "").strip()
+
+            shop_link = normalize_shop_name(raw_shop)
+            amount = normalize_amount(raw_amount)
+            note = format_comment(raw_note)
 
-    rows = list(csv.DictReader(content.splitlines(), fieldnames=fieldnames))
-    logger.debug(f"🔍 Всего строк в файле: {len(rows)}")
+            # 📅 Получение даты ДО фильтрации
+            created_at_raw = (row.get("Дата и время") or "").strip()
 
-    new_cnt = 0
+            if not created_at_raw and None in row and len(row[None]) >= 6:
+                created_at_raw = row[None][5]
 
-    with sqlite3.connect(DB_PATH) as con:
-        for row in rows:
-            logger.debug(f"DEBUG ROW: {row}")
             try:
-                raw_shop = row["Магазин"].strip()
-                raw_amount = row["Номиналы и сумма"].strip()
-                raw_note = (row.get("Комментарий") or "").strip()
-
-                shop_link = normalize_shop_name(raw_shop)
-                amount = normalize_amount(raw_amount)
-                note = format_comment(raw_note)
-
-                # 📅 Получение даты ДО фильтрации
-                created_at_raw = (row.get("Дата и время") or "").strip()
-
-                if not created_at_raw and None in row and len(row[None]) >= 6:
-                    created_at_raw = row[None][5]
-
-                try:
-                    created_at_dt = parser.parse(created_at_raw)
-                    created_at = created_at_dt.isoformat()
-                except Exception:
-                    logger.warning("⚠️ Не удалось разобрать дату: %s", created_at_raw)
-                    created_at = datetime.utcnow().isoformat()
-
-                # 🧼 Фильтрация (с датой в логе)
-                if is_spammy_shop(shop_link) or is_spammy_amount(amount) or is_spammy_note(note):
-                    logger.warning("⛔ Спам-заявка пропущена: %s | %s | %s | %s",
-                                   shop_link, amount, note, shorten_date(created_at))
-                    continue
-
-                # 🔒 Пропуск забронированных
-                exists_reserved = con.execute(
-                    "SELECT 1 FROM requests WHERE shop_link=? AND amount=? AND note=? AND reserved_by IS NOT NULL",
-                    (shop_link, amount, note)
-                ).fetchone()
-
-                if exists_reserved:
-                    logger.info("🛑 Пропущена забронированная заявка: %s | %s", shop_link, amount)
-                    continue
-
-                # 🧾 Проверка на точный дубликат
-                exists = con.execute(
-                    "SELECT 1 FROM requests WHERE shop_link=? AND amount=? AND note=? AND created_at=?",
-                    (shop_link, amount, note, created_at)
-                ).fetchone()
-
-                if not exists:
-                    con.execute(
-                        "INSERT INTO requests (shop_link, amount, note, created_at) VALUES (?, ?, ?, ?)",
-                        (shop_link, amount, note, created_at)
-                    )
-                    logger.info("➕ Новая заявка: %s | %s | %s", shop_link, amount, shorten_date(created_at))
-                    new_cnt += 1
-
-            except Exception as e:
-                logger.error("❌ Ошибка при обработке строки: %s — %s", row, e, exc_info=True)
-
-        con.commit()
+                created_at_dt = parser.parse(created_at_raw)
+                created_at = utc_iso(created_at_dt)
+            except Exception:
+                logger.warning("⚠️ Не удалось разобрать дату: %s", created_at_raw)
+                created_at = utc_iso(datetime.now(timezone.utc))
+
+            # 🧼 Фильтрация
+            if is_spammy_shop(shop_link) or is_spammy_amount(amount) or is_spammy_note(note):
+                spam_cnt += 1
+                continue
 
-    if new_cnt:
-        logger.info("✅ Импортировано новых заявок: %s", new_cnt)
-    else:
-        logger.info("ℹ️ Новых заявок не найдено")
+            batch.append((shop_link, amount, note, created_at, *display_columns(shop_link, amount, created_at)))
+
+        except Exception as e:
+            # warning, а не error: битые строки идут пачками и упираются в лимит логов с этого места
+            logger.warning("❌ Ошибка при обработке строки: %s — %s", row, e, exc_info=True)
+
+    return batch, spam_cnt
+
+
+def bulk_insert_requests(con: sqlite3.Connection, batch: list[tuple]) -> tuple[int, int, int]:
+    """
+    Вставляет пачку нормализованных заявок одним INSERT ... SELECT.
+    Возвращает (новых, пропущено забронированных, пропущено дубликатов).
+    """
+    if not batch:
+        return 0, 0, 0
+
+    con.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS import_batch (shop_link, amount, note, created_at, {IMPORT_DISPLAY})"
+    )
+    con.execute("DELETE FROM import_batch")
+    con.executemany(f"INSERT INTO import_batch VALUES ({', '.join('?' * len(batch[0]))})", batch)
+
+    # 🔒 Такая же заявка уже у кого-то в брони — не дублируем
+    reserved_sql = """
+        EXISTS (
+            SELECT 1 FROM requests r
+            WHERE r.shop_link=b.shop_link AND r.amount=b.amount AND r.note=b.note
+              AND r.reserved_by IS NOT NULL
+        )
+    """
+    reserved_cnt = con.execute(
+        f"SELECT COUNT(*) FROM import_batch b WHERE {reserved_sql}"
+    ).fetchone()[0]
+
+    # 🧾 Точные дубликаты отсекает UNIQUE-индекс idx_requests_dedupe
+    cur = con.execute(
+        f"""
+        INSERT OR IGNORE INTO requests (shop_link, amount, note, created_at, {IMPORT_DISPLAY})
+        SELECT b.shop_link, b.amount, b.note, b.created_at, {", ".join("b." + c for c in DISPLAY_COLUMNS)}
+        FROM import_batch b
+        WHERE NOT {reserved_sql}
+        ORDER BY b.rowid
+        """
+    )
+    new_cnt = cur.rowcount
+    con.execute("DELETE FROM import_batch")
+
+    return new_cnt, reserved_cnt, len(batch) - reserved_cnt - new_cnt
 
 # ================== GLOBAL STORAGE ==================
-user_messages = {}
+# Экраны меню, которые бот показал пользователю (чтобы убрать их при переходе).
+# С db хранятся в SQLite — переживают рестарт и общие для всех воркеров;
+# MessageTracker() без db держит их только в памяти.
+TRACKED_MESSAGES_PER_USER = 20
+tracked_messages = MessageTracker(db, per_user=TRACKED_MESSAGES_PER_USER)
 
 # ================== SCHEDULER ==================
-def schedule_release(rid, until):
-    delay = (until - datetime.now(timezone.utc)).total_seconds()
-
-    async def release_job():
-        with sqlite3.connect(DB_PATH) as con:
-            con.execute(
-                "UPDATE requests SET reserved_by=NULL, reserved_until=NULL WHERE id=? AND reserved_until <= ?",
-                (rid, datetime.now(timezone.utc).isoformat())
-            )
-            con.commit()
-        print(f"🔓 Auto-released RID={rid}")
-
-    job_id = f"release_{rid}"
-    scheduler.add_job(
-        lambda: asyncio.create_task(release_job()),
-        trigger="date",
-        run_date=until,
-        id=job_id,
-        replace_existing=True
+# Один подметальщик на все брони: снимает просроченные одним UPDATE и рассылает
+# наступившие напоминания (таблица scheduled_jobs), затем спит до ближайшего срока.
+def reminder_text(lang: str, rid: int) -> str:
+    return lang_text(
+        lang,
+        f"🔔 Напоминание: осталось 24 ч, чтобы завершить заявку #{rid}.\nПроверьте её в разделе 📋 Мои заявки.",
+        f"🔔 Reminder: 24 h left to finish request #{rid}.\nCheck it in 📋 My Requests."
     )
-    print(f"⏰ Scheduled auto-release in {int(delay)}s")
-
-def schedule_reminder(rid: int, uid: int):
-    remind_at = datetime.now(timezone.utc) + timedelta(hours=24)
 
-    async def remind_job():
-        lang = get_lang(uid)
-        text = lang_text(
-            lang,
-            f"🔔 Напоминание: осталось 24 ч, чтобы завершить заявку #{rid}.\nПроверьте её в разделе 📋 Мои заявки.",
-            f"🔔 Reminder: 24 h left to finish request #{rid}.\nCheck it in 📋 My Requests."
+def _sweep(con: sqlite3.Connection, now: str) -> tuple[int, list[tuple], str | None]:
+    """
+    Пакетно: (снято броней, напоминания (msg_id, uid, rid, text), ближайший следующий срок).
+    Напоминания пишутся в outbox в той же транзакции, что удаляет их задания:
+    упади бот сразу после коммита — Outbox.start() дошлёт их после рестарта.
+    """
+    released = con.execute(
+        "UPDATE requests SET reserved_by=NULL, reserved_until=NULL "
+        "WHERE reserved_by IS NOT NULL AND reserved_until <= ?",
+        (now,)
+    ).rowcount
+
+    # Напоминаем только по броням, которые всё ещё у того же пользователя
+    due_reminders = []
+    for rid, uid, lang in con.execute(
+        """
+        SELECT j.rid, j.uid, COALESCE(u.lang, 'ru') FROM scheduled_jobs j
+        JOIN requests r ON r.id = j.rid AND r.reserved_by = j.uid
+        LEFT JOIN users u ON u.user_id = j.uid
+        WHERE j.kind = 'remind' AND j.run_at <= ?
+        """,
+        (now,)
+    ).fetchall():
+        text = reminder_text(lang, rid)
+        due_reminders.append((store_message(con, uid, text), uid, rid, text))
+    con.execute("DELETE FROM scheduled_jobs WHERE run_at <= ?", (now,))
+
+    next_at = con.execute(
+        """
+        SELECT MIN(t) FROM (
+            SELECT MIN(reserved_until) AS t FROM requests WHERE reserved_by IS NOT NULL
+            UNION ALL
+            SELECT MIN(run_at) FROM scheduled_jobs
         )
-        try:
-            await bot.send_message(uid, text)
-            print(f"🔔 Reminder sent to UID={uid} for RID={rid}")
-        except Exception as e:
-            print(f"⚠️ Failed to send reminder: {e}")
-
-    job_id = f"remind_{rid}"
-    scheduler.add_job(
-        lambda: asyncio.create_task(remind_job()),
-        trigger="date",
-        run_date=remind_at,
-        id=job_id,
-        replace_existing=True
+        """
+    ).fetchone()[0]
+    return released, due_reminders, next_at
+
+async def sweep_reservations() -> datetime | None:
+    released, due_reminders, next_at = await db.run(_sweep, utc_iso(datetime.now(timezone.utc)))
+
+    if released:
+        invalidate_pages()
+    # 📬 Уже в outbox — осталось поставить в очередь: лимиты Telegram, RetryAfter и повторы — её забота
+    for msg_id, uid, rid, text in due_reminders:
+        outbox.enqueue(msg_id, uid, text)
+        logger.info("🔔 Напоминание в очереди: UID=%s, RID=%s", uid, rid)
+    if released or due_reminders:
+        logger.info("🔓 Снято просроченных броней: %s, напоминаний: %s", released, len(due_reminders))
+
+    return datetime.fromisoformat(next_at) if next_at else None
+
+sweeper = DeadlineSweeper(counted_job("sweeper", sweep_reservations))
+loop_lag = LoopLagMonitor()
+outbox = Outbox(bot, db)
+cleaner = BackgroundCleaner()
+
+async def schedule_release(rid: int, until: datetime):
+    sweeper.notify(until)
+    logger.debug("⏰ Автоснятие брони RID=%s в %s", rid, until.isoformat())
+
+async def schedule_reminder(rid: int, uid: int):
+    remind_at = datetime.now(timezone.utc) + timedelta(hours=24)
+    await db.execute(
+        "INSERT OR REPLACE INTO scheduled_jobs (job_id, kind, rid, uid, run_at) VALUES (?, 'remind', ?, ?, ?)",
+        (f"remind_{rid}", rid, uid, utc_iso(remind_at))
     )
-    print(f"⏰ Scheduled reminder at {remind_at.isoformat()}")
+    sweeper.notify(remind_at)
+    logger.debug("⏰ Напоминание по RID=%s в %s", rid, remind_at.isoformat())
+
+async def unschedule(rid: int):
+    """Убирает напоминания по заявке (при отмене брони)."""
+    await db.execute("DELETE FROM scheduled_jobs WHERE rid=?", (rid,))
 
 # ================== STATE HANDLER ==================
-@router.callback_query(F.data.in_({"lang_ru", "lang_en"}))
+@callbacks.on("lang_ru")
+@callbacks.on("lang_en")
 async def set_language(cb: types.CallbackQuery, state: FSMContext):
     lang = "ru" if cb.data == "lang_ru" else "en"
 
-    with sqlite3.connect(DB_PATH) as con:
-        con.execute(
-            "INSERT OR REPLACE INTO users (user_id, lang) VALUES (?, ?)",
-            (cb.from_user.id, lang)
-        )
-        con.commit()
+    await db.execute(
+        "INSERT OR REPLACE INTO users (user_id, lang) VALUES (?, ?)",
+        (cb.from_user.id, lang)
+    )
+    lang_cache.set(cb.from_user.id, lang)
 
     await state.clear()
     await show_main_menu(cb.message.chat.id, cb.from_user.id, cb.message)
@@ -395,22 +574,11 @@ async def set_language(cb: types.CallbackQuery, state: FSMContext):
 
 
 # ================== BROWSE CALLBACK ==================
-@router.callback_query(F.data.startswith("browse:"))
-async def cb_browse(callback: types.CallbackQuery):
+@callbacks.on(BrowseCb)
+async def cb_browse(callback: types.CallbackQuery, data: BrowseCb):
     uid = callback.from_user.id
-    lang = get_lang(uid)
-
-    try:
-        offset = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer(
-            lang_text(lang, "Неверный формат", "Invalid format"),
-            show_alert=True
-        )
-        return
-
-    await delete_old_messages(bot, callback.message.chat.id, uid)
-    await show_requests(callback.message.chat.id, uid, offset)
+    # Формат курсора уже проверен фабрикой BrowseCb
+    await show_requests(callback.message.chat.id, uid, data.token, callback.message)
     await callback.answer()
 
 # ──────────── ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ────────────
@@ -443,7 +611,7 @@ def main_menu_kb(lang: str) -> InlineKeyboardMarkup:
             [
                 InlineKeyboardButton(
                     text=lang_text(lang, "📦 Все заявки", "📦 All Requests"),
-                    callback_data="browse:0"
+                    callback_data=BrowseCb(token="1").pack()
                 )
             ]
         ]
@@ -454,40 +622,76 @@ def lang_text(lang: str, ru: str, en: str) -> str:
     """Возвращает текст на нужном языке."""
     return ru if lang == "ru" else en
 
-def get_lang(user_id: int) -> str:
-    """Получает язык пользователя из БД, по умолчанию 'ru'."""
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute("SELECT lang FROM users WHERE user_id=?", (user_id,)).fetchone()
-        return row[0] if row else "ru"
+# 🗂 Кэш языков: заполняется при старте и по промахам, set_language пишет сквозь него
+LANG_CACHE_SIZE = 50_000
+lang_cache: LRUCache[int, str] = LRUCache(LANG_CACHE_SIZE)
+watch_cache("lang", lang_cache)
+
+async def get_lang(user_id: int) -> str:
+    """Получает язык пользователя (кэш, затем БД), по умолчанию 'ru'."""
+    lang = lang_cache.get(user_id)
+    if lang is None:
+        row = await db.fetchone("SELECT lang FROM users WHERE user_id=?", (user_id,))
+        lang = row[0] if row else "ru"
+        lang_cache.set(user_id, lang)
+    return lang
+
+async def preload_lang_cache() -> None:
+    rows = await db.fetchall("SELECT user_id, lang FROM users LIMIT ?", (LANG_CACHE_SIZE,))
+    for user_id, lang in rows:
+        lang_cache.set(user_id, lang)
+    logger.info("🗂 Языки в кэше: %s", len(lang_cache))
 
 # ──────────── УДАЛЕНИЕ СТАРЫХ СООБЩЕНИЙ ────────────
 async def delete_old_messages(bot: Bot, chat_id: int, user_id: int):
-    messages = user_messages.get(user_id, [])
-    for msg_id in messages:
+    """
+    Убирает прошлые экраны пользователя в фоне: следующий экран уходит сразу,
+    не дожидаясь удаления. Список id забираем до отправки нового экрана.
+    """
+    cleaner.schedule(bot, chat_id, await tracked_messages.take(user_id))
+
+
+# ──────────── ПОКАЗ ЭКРАНА ────────────
+async def render_screen(
+    chat_id: int,
+    user_id: int,
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    edit_message: types.Message | None = None,
+):
+    """
+    Показывает экран одним вызовом API: правит edit_message на месте, а если
+    его нет или править нельзя (удалено, старше 48 ч) — шлёт новое сообщение
+    и убирает прошлые экраны.
+    """
+    if edit_message is not None:
         try:
-            await bot.delete_message(chat_id, msg_id)
-        except Exception:
-            pass  # например, сообщение уже удалено
-    user_messages[user_id] = []
+            await edit_message.edit_text(text, reply_markup=reply_markup)
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+
+    await delete_old_messages(bot, chat_id, user_id)
+    msg = await bot.send_message(chat_id, text, reply_markup=reply_markup)
+    await tracked_messages.add(user_id, msg.message_id)
+
+
+async def prune_tracked_messages() -> None:
+    removed = await tracked_messages.prune()
+    if removed:
+        logger.info("🧹 Забыто устаревших экранов: %s", removed)
 
 # ──────────────── ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ────────────────
-def generate_my_request_text(shop: str, amount: str, note: str, created_at: str, reserved_until: str) -> str:
+def generate_my_request_text(site: str, display_amount: str, note: str, date_full: str, reserved_until: str) -> str:
     """Формирует текст заявки для 'Моих заявок'."""
-    domain = shop.replace("www.", "")
-    if "." not in domain:
-        domain += ".com"
-    display_amount = amount if "$" in amount else f"${amount}"
-    text = f"🌐 Сайт: {domain}\n💵 Сумма заказа: {display_amount}"
+    text = f"🌐 Сайт: {site}\n💵 Сумма заказа: {display_amount}"
 
     if note and note.lower() not in {"-", "без комментариев", "no comments"}:
         text += f"\n🔹 Номиналы: {note}"
 
-    if created_at:
-        try:
-            date_str = datetime.fromisoformat(created_at).strftime("%d.%m.%Y %H:%M")
-            text += f"\n📅 Добавлено: {date_str}"
-        except Exception:
-            pass
+    if date_full:
+        text += f"\n📅 Добавлено: {date_full}"
 
     try:
         r_until = datetime.fromisoformat(reserved_until)
@@ -503,12 +707,10 @@ def generate_my_request_text(shop: str, amount: str, note: str, created_at: str,
 
     return text
 
-# ───────── ЗАЯВКИ: клавиатура 2×N ─────────
-def format_shop_title(shop_link: str) -> str:
-    parts = shop_link.replace("www.", "").split(".")
-    return parts[0].capitalize() if parts else shop_link.capitalize()
-
 # ---------- МОИ ЗАЯВКИ: generate_request_buttons ----------
+def browse_data(offset: int, my: bool) -> str:
+    return MyBrowseCb(offset=offset).pack() if my else BrowseCb(token=str(offset)).pack()
+
 def generate_request_buttons(
     requests: list[dict],
     lang: str = "ru",
@@ -520,21 +722,16 @@ def generate_request_buttons(
 
     for req in requests:
         rid = req["id"]
-        shop_title = format_shop_title(req["shop_link"])
-        amount = req["amount"] if "$" in req["amount"] else f"${req['amount']}"
-        created_at = req.get("created_at")
-        date_str = shorten_date(created_at, lang) if created_at else "??.??"
-        print(f"➡️ created_at: {created_at} → {date_str}")
-        text = f"🧾 {shop_title} | {amount} | {date_str}"
+        text = f"🧾 {req['title']} | {req['display_amount']} | {req['date'] or '??.??'}"
         if my:
             buttons.append([
-                InlineKeyboardButton(text=text, callback_data=f"my:{rid}:{offset}")
+                InlineKeyboardButton(text=text, callback_data=MyRequestCb(rid=rid, offset=offset).pack())
             ])
         else:
             row.append(
                 InlineKeyboardButton(
                     text=text,
-                    callback_data=f"view:{rid}:{offset}"
+                    callback_data=ViewCb(rid=rid, token=str(offset)).pack()
                 )
             )
             if len(row) == 2:
@@ -549,14 +746,14 @@ def generate_request_buttons(
         nav_row.append(
             InlineKeyboardButton(
                 text=lang_text(lang, "← Назад", "← Back"),
-                callback_data=("mybrowse:" if my else "browse:") + str(offset - LIMIT)
+                callback_data=browse_data(offset - LIMIT, my)
             )
         )
     if offset + LIMIT < total:
         nav_row.append(
             InlineKeyboardButton(
                 text=lang_text(lang, "Вперёд →", "Next →"),
-                callback_data=("mybrowse:" if my else "browse:") + str(offset + LIMIT)
+                callback_data=browse_data(offset + LIMIT, my)
             )
         )
     if nav_row:
@@ -572,29 +769,20 @@ def generate_request_buttons(
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # ---------- МОЯ ЗАЯВКА ПОДРОБНО ----------
-@router.callback_query(F.data.startswith("my:"))
-async def cb_my_request_detail(callback: types.CallbackQuery):
+@callbacks.on(MyRequestCb)
+async def cb_my_request_detail(callback: types.CallbackQuery, data: MyRequestCb):
     uid = callback.from_user.id
-    lang = get_lang(uid)
-
-    try:
-        rid, offset = map(int, callback.data.split(":")[1:])
-    except ValueError:
-        await callback.answer(
-            lang_text(lang, "Неверный формат", "Invalid format"),
-            show_alert=True
-        )
-        return
-
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute(
-            """
-            SELECT shop_link, amount, note, reserved_until, created_at
-            FROM requests
-            WHERE id=? AND reserved_by=?
-            """,
-            (rid, uid),
-        ).fetchone()
+    lang = await get_lang(uid)
+    rid = data.rid
+
+    row = await db.fetchone(
+        """
+        SELECT site, display_amount, note, reserved_until, date_full
+        FROM requests
+        WHERE id=? AND reserved_by=?
+        """,
+        (rid, uid),
+    )
 
     if not row:
         await callback.answer(
@@ -603,18 +791,18 @@ async def cb_my_request_detail(callback: types.CallbackQuery):
         )
         return
 
-    shop, amount, note, r_until, created_at = row
-    text = generate_my_request_text(shop, amount, note, created_at, r_until)
+    site, amount, note, r_until, date_full = row
+    text = generate_my_request_text(site, amount, note, date_full, r_until)
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text=lang_text(lang, "⏳ Продлить", "⏳ Extend"),
-                callback_data=f"renew:{rid}:my"
+                callback_data=RenewCb(rid=rid, back="my").pack()
             ),
             InlineKeyboardButton(
                 text=lang_text(lang, "❌ Отменить бронь", "❌ Cancel"),
-                callback_data=f"cancel:{rid}:my"
+                callback_data=CancelCb(rid=rid, back="my").pack()
             )
         ],
         [
@@ -625,74 +813,141 @@ async def cb_my_request_detail(callback: types.CallbackQuery):
         ]
     ])
 
-    await delete_old_messages(bot, callback.message.chat.id, uid)
-
-    msg = await callback.message.answer(text, reply_markup=kb)
-    user_messages.setdefault(uid, []).append(msg.message_id)
+    await render_screen(callback.message.chat.id, uid, text, kb, callback.message)
+    await callback.answer()
 
 
 # ---------- ФУНКЦИЯ: Получение заявок по дате (новые сверху) ----------
-def get_requests_page(offset: int = 0, limit: int = 20) -> list[dict]:
-    with sqlite3.connect(DB_PATH) as con:
-        rows = con.execute(
-            """
-            SELECT id, shop_link, amount, created_at
-            FROM requests
-            WHERE reserved_by IS NULL
-            ORDER BY datetime(created_at) DESC
-            LIMIT ? OFFSET ?
-            """,
-            (limit, offset)
-        ).fetchall()
+async def get_requests_page(offset: int = 0, limit: int = 20) -> list[dict]:
+    rows = await db.fetchall(
+        """
+        SELECT id, shop_link, amount, created_at
+        FROM requests
+        WHERE reserved_by IS NULL
+        ORDER BY created_at DESC
+        LIMIT ? OFFSET ?
+        """,
+        (limit, offset)
+    )
 
     return [
         {"id": rid, "shop_link": shop, "amount": amt, "created_at": created_at}
         for rid, shop, amt, created_at in rows
     ]
 
-# ================== ОБНОВЛЁННЫЙ show_requests ==================
-async def show_requests(chat_id: int, user_id: int, offset: int = 0):
-    now = datetime.now(timezone.utc)
-    cutoff = now - timedelta(days=14)
-    lang = get_lang(user_id)
+# ---------- КУРСОР СТРАНИЦЫ (keyset-пагинация) ----------
+# Токен в callback_data: "{page}" — первая страница,
+# "{page}{n|p|a}{epoch}.{id}" — заявки после / до / начиная с (created_at, id).
+# Без ":" внутри и с запасом укладывается в 64 байта. Формат — PAGE_TOKEN_RE (utils/callbacks.py).
+
+# Заявка видна всем, если свободна или её бронь истекла
+AVAILABLE_SQL = "created_at >= :cutoff AND (reserved_by IS NULL OR reserved_until <= :now)"
+
+
+def page_token(page: int, kind: str, created_at: str, rid: int) -> str:
+    epoch = int(datetime.fromisoformat(created_at).timestamp())
+    return f"{page}{kind}{epoch}.{rid}"
 
-    with sqlite3.connect(DB_PATH) as con:
+
+def parse_page_token(token: str) -> tuple[int, str | None, str | None, int | None]:
+    """
+    (номер страницы, вид курсора, created_at, id). Старые токены-смещения
+    и всё, что не разбирается (в том числе время вне диапазона datetime), -> первая страница.
+    """
+    first = (1, None, None, None)
+    m = PAGE_TOKEN_RE.fullmatch(token)
+    if not m:
+        return first
+    page, kind, epoch, rid = m.groups()
+    if not kind:
+        return first
+    try:
+        created_at = utc_iso(datetime.fromtimestamp(int(epoch), tz=timezone.utc))
+    except (ValueError, OverflowError, OSError):
+        return first
+    return max(1, int(page)), kind, created_at, int(rid)
+
+
+def fetch_requests_page(con: sqlite3.Connection, now: str, cutoff: str, token: str) -> tuple[list[tuple], int, int, bool]:
+    """
+    Страница доступных заявок по курсору (индекс idx_requests_browse).
+    Возвращает (строки, номер страницы, всего доступных, есть ли следующая).
+    """
+    page, kind, created_at, rid = parse_page_token(token)
+    params = {"cutoff": cutoff, "now": now, "created_at": created_at, "rid": rid, "limit": LIMIT + 1}
+    select = f"SELECT id, title, display_amount, date_ru, created_at FROM requests WHERE {AVAILABLE_SQL}"
+
+    rows = None
+    if kind == "p":
         rows = con.execute(
-            """
-            SELECT id, shop_link, amount, note,
-                   reserved_by, reserved_until, created_at
-            FROM requests
-            WHERE datetime(created_at) >= ?
-            ORDER BY created_at DESC
-            LIMIT ? OFFSET ?
-            """,
-            (cutoff.isoformat(), LIMIT, offset),
+            f"{select} AND (created_at, id) > (:created_at, :rid) ORDER BY created_at, id LIMIT :limit",
+            params,
         ).fetchall()
+        if len(rows) > LIMIT:
+            rows = rows[:LIMIT][::-1]
+            has_next = True
+        else:
+            # Выше курсора меньше страницы — значит, это уже первая страница
+            rows, page, kind = None, 1, None
 
-        total = con.execute(
-            "SELECT COUNT(*) FROM requests WHERE datetime(created_at) >= ?",
-            (cutoff.isoformat(),)
-        ).fetchone()[0]
-
-    # 👁 Отбор только незабронированных или истекших
-    visible = []
-    for rid, shop, amt, note, r_by, r_until, created_at in rows:
-        if r_by and r_until:
-            r_until_dt = datetime.fromisoformat(r_until)
-            if r_until_dt.tzinfo is None:
-                r_until_dt = r_until_dt.replace(tzinfo=timezone.utc)
-            if r_until_dt > now:
-                continue
-        visible.append((rid, shop, amt, shorten_date(created_at)))
+    if rows is None:
+        cond = {None: "", "n": "AND (created_at, id) < (:created_at, :rid)",
+                "a": "AND (created_at, id) <= (:created_at, :rid)"}[kind]
+        rows = con.execute(
+            f"{select} {cond} ORDER BY created_at DESC, id DESC LIMIT :limit",
+            params,
+        ).fetchall()
+        has_next = len(rows) > LIMIT
+        rows = rows[:LIMIT]
+
+    total = con.execute(f"SELECT COUNT(*) FROM requests WHERE {AVAILABLE_SQL}", params).fetchone()[0]
+
+    return rows, page, total, has_next
+
+# ================== ОБНОВЛЁННЫЙ show_requests ==================
+# 🗃 Готовые страницы по (язык, курсор). Список меняется только при импорте, брони,
+# отмене, продлении и снятии просроченных — они вызывают invalidate_pages().
+# TTL — на случай изменений из другого воркера и сдвига 14-дневного окна.
+PAGE_CACHE_SIZE = 2_000
+PAGE_CACHE_TTL = 60
+page_cache: VersionedCache[tuple[str, str], tuple[str, InlineKeyboardMarkup]] = VersionedCache(
+    PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL
+)
+watch_cache("page", page_cache)
+
+def invalidate_pages() -> None:
+    page_cache.bump()
+
+async def show_requests(chat_id: int, user_id: int, token: str = "1", edit_message: types.Message | None = None):
+    lang = await get_lang(user_id)
+
+    screen = page_cache.get((lang, token))
+    if screen is None:
+        # Версию берём до чтения из БД: если бронь/импорт успеют сбросить кэш,
+        # пока страница рисуется, старая страница в кэш не попадёт
+        version = page_cache.version
+        screen = await render_requests_page(lang, token)
+        page_cache.set((lang, token), screen, version)
+
+    text, markup = screen
+    await render_screen(chat_id, user_id, text, markup, edit_message)
+
+
+async def render_requests_page(lang: str, token: str) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы доступных заявок — одинаковые для всех пользователей с этим языком."""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=14)
+
+    # 👁 Забронированные отсеиваются в SQL — страница всегда полная, total точный
+    rows, page, total, has_next = await db.read(fetch_requests_page, utc_iso(now), utc_iso(cutoff), token)
+    here = page_token(page, "a", rows[0][4], rows[0][0]) if rows else "1"
 
     # 📦 Генерация кнопок
     buttons, row_buf = [], []
-    for rid, shop, amt, date_str in visible:
-        title = format_shop_title(shop)
-        amount = amt if "$" in amt else f"${amt}"
+    for rid, title, amount, date_ru, _ in rows:
         row_buf.append(InlineKeyboardButton(
-            text=f"🧾 {title} | {amount} | {date_str}",
-            callback_data=f"view:{rid}:{offset}"
+            text=f"🧾 {title} | {amount} | {date_ru or '??.??'}",
+            callback_data=ViewCb(rid=rid, token=here).pack()
         ))
         if len(row_buf) == 2:
             buttons.append(row_buf)
@@ -702,15 +957,15 @@ async def show_requests(chat_id: int, user_id: int, offset: int = 0):
 
     # 🔁 Навигация
     nav_row = []
-    if offset >= LIMIT:
+    if page > 1 and rows:
         nav_row.append(InlineKeyboardButton(
             text=lang_text(lang, "← Назад", "← Back"),
-            callback_data=f"browse:{offset - LIMIT}"
+            callback_data=BrowseCb(token=page_token(page - 1, "p", rows[0][4], rows[0][0])).pack()
         ))
-    if (offset + LIMIT) < total:
+    if has_next:
         nav_row.append(InlineKeyboardButton(
             text=lang_text(lang, "Вперёд →", "Next →"),
-            callback_data=f"browse:{offset + LIMIT}"
+            callback_data=BrowseCb(token=page_token(page + 1, "n", rows[-1][4], rows[-1][0])).pack()
         ))
     if nav_row:
         buttons.append(nav_row)
@@ -724,54 +979,52 @@ async def show_requests(chat_id: int, user_id: int, offset: int = 0):
     ])
 
     # 📄 Отправка
-    current_page = offset // LIMIT + 1
-    total_pages = max(1, ceil(total / LIMIT))
-    header = lang_text(lang, f"🗂 Страница {current_page} из {total_pages}", f"🗂 Page {current_page} of {total_pages}")
+    total_pages = max(1, ceil(total / LIMIT), page)
+    header = lang_text(lang, f"🗂 Страница {page} из {total_pages}", f"🗂 Page {page} of {total_pages}")
 
-    await delete_old_messages(bot, chat_id, user_id)
-    msg = await bot.send_message(
-        chat_id,
-        f"{header}\n\n" + lang_text(lang, "🛍 Доступные заявки:", "🛍 Available requests:"),
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
-    )
-    user_messages.setdefault(user_id, []).append(msg.message_id)
+    text = f"{header}\n\n" + lang_text(lang, "🛍 Доступные заявки:", "🛍 Available requests:")
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # ---------- МОИ ЗАЯВКИ: show_my_requests ----------
-async def show_my_requests(chat_id: int, user_id: int, offset: int = 0):
+def fetch_my_requests_page(con: sqlite3.Connection, user_id: int, cutoff: str, offset: int) -> tuple[list[tuple], int]:
+    rows = con.execute(
+        """
+        SELECT id, title, display_amount, date_ru, date_en
+        FROM requests
+        WHERE reserved_by = ? AND created_at >= ?
+        ORDER BY created_at DESC
+        LIMIT ? OFFSET ?
+        """,
+        (user_id, cutoff, LIMIT, offset),
+    ).fetchall()
+
+    total = con.execute(
+        """
+        SELECT COUNT(*) FROM requests
+        WHERE reserved_by = ? AND created_at >= ?
+        """,
+        (user_id, cutoff),
+    ).fetchone()[0]
+
+    return rows, total
+
+
+async def show_my_requests(chat_id: int, user_id: int, offset: int = 0, edit_message: types.Message | None = None):
     now = datetime.now(timezone.utc)
     cutoff = now - timedelta(days=14)
-    lang = get_lang(user_id)
+    lang = await get_lang(user_id)
 
-    with sqlite3.connect(DB_PATH) as con:
-        rows = con.execute(
-            """
-            SELECT id, shop_link, amount, reserved_until, created_at
-            FROM requests
-            WHERE reserved_by = ? AND datetime(created_at) >= ?
-            ORDER BY datetime(created_at) DESC
-            LIMIT ? OFFSET ?
-            """,
-            (user_id, cutoff.isoformat(), LIMIT, offset),
-        ).fetchall()
-
-        total = con.execute(
-            """
-            SELECT COUNT(*) FROM requests
-            WHERE reserved_by = ? AND datetime(created_at) >= ?
-            """,
-            (user_id, cutoff.isoformat()),
-        ).fetchone()[0]
+    rows, total = await db.read(fetch_my_requests_page, user_id, utc_iso(cutoff), offset)
 
     # 🔁 Сбор данных
     requests = [
         {
             "id": rid,
-            "shop_link": shop,
-            "amount": amt,
-            "reserved_until": r_until,
-            "created_at": created_at
+            "title": title,
+            "display_amount": amount,
+            "date": date_ru if lang == "ru" else date_en
         }
-        for rid, shop, amt, r_until, created_at in rows
+        for rid, title, amount, date_ru, date_en in rows
     ]
 
     # 📦 Генерация кнопок
@@ -792,309 +1045,217 @@ async def show_my_requests(chat_id: int, user_id: int, offset: int = 0):
         f"📋 My Requests ({len(requests)} of {total})\n🗂 Page {current_page} of {total_pages}"
     )
 
-    await delete_old_messages(bot, chat_id, user_id)
-
-    msg = await bot.send_message(
+    await render_screen(
         chat_id,
+        user_id,
         f"{header}\n\n" + lang_text(lang, "Выберите заявку для просмотра:", "Select a request to view:"),
-        reply_markup=buttons
+        buttons,
+        edit_message
     )
 
-    user_messages.setdefault(user_id, []).append(msg.message_id)
-
-# ---------- МОИ ЗАЯВКИ: BACK ----------
-@router.callback_query(F.data.startswith("browse:"))
-async def cb_browse(callback: types.CallbackQuery):
-    try:
-        offset = int(callback.data.split(":")[1])
-    except (ValueError, IndexError):
-        await callback.answer(
-            lang_text(get_lang(callback.from_user.id), "Неверный сдвиг", "Invalid offset"),
-            show_alert=True
-        )
-        return
-
+# ---------- МОИ ЗАЯВКИ: листание ----------
+@callbacks.on(MyBrowseCb)
+async def cb_my_browse(callback: types.CallbackQuery, data: MyBrowseCb):
     uid = callback.from_user.id
-    await delete_old_messages(bot, callback.message.chat.id, uid)
-    await show_requests(callback.message.chat.id, uid, offset)
+    await show_my_requests(callback.message.chat.id, uid, max(0, data.offset), callback.message)
     await callback.answer()
 
 # ─────────────────── ОБРАБОТЧИК МОИХ ЗАЯВОК ───────────────────
-@router.callback_query(F.data == "my_requests")
+@callbacks.on("my_requests")
 async def cb_my_requests(callback: types.CallbackQuery):
     uid = callback.from_user.id
-    await show_my_requests(callback.message.chat.id, uid)
+    await show_my_requests(callback.message.chat.id, uid, edit_message=callback.message)
     await callback.answer()
 
 
-@router.callback_query(F.data == "all_requests")
+@callbacks.on("all_requests")
 async def cb_all_requests(callback: types.CallbackQuery):
-    await show_catalog(callback.message.chat.id, callback.from_user.id)
+    # Кнопка из старых меню — то же, что browse:1
+    await show_requests(callback.message.chat.id, callback.from_user.id, "1", callback.message)
     await callback.answer()
 
 # ─────────────────── ОБРАБОТЧИК отправки карты ───────────────────
-@router.callback_query(F.data == "submit_card")
+@callbacks.on("submit_card")
 async def cb_submit_card(callback: types.CallbackQuery):
-    lang = get_lang(callback.from_user.id)
+    lang = await get_lang(callback.from_user.id)
     chat_id = callback.message.chat.id
     uid = callback.from_user.id
 
-    await delete_old_messages(bot, chat_id, uid)
-
-    msg = await callback.message.answer(
+    await render_screen(
+        chat_id,
+        uid,
         lang_text(
             lang,
             "💳 Пожалуйста, отправьте данные карты сюда сообщением.",
             "💳 Please send your card details here as a message."
         ),
-        reply_markup=back_to_menu_kb(lang)
+        back_to_menu_kb(lang),
+        callback.message
     )
 
-    user_messages.setdefault(uid, []).append(msg.message_id)
 
-    try:
-        await callback.message.delete()
-    except:
-        pass
-
-
-@router.callback_query(F.data == "to_main_menu")
+@callbacks.on("to_main_menu")
 async def cb_to_main(callback: types.CallbackQuery):
     uid = callback.from_user.id
-    chat_id = callback.message.chat.id
-
-    await delete_old_messages(bot, chat_id, uid)
-
-    lang = get_lang(uid)
-
-    try:
-        await callback.message.delete()
-    except:
-        pass
-
-    msg = await bot.send_message(
-        chat_id,
-        lang_text(lang, "✨ Главное меню:", "✨ Main menu:"),
-        reply_markup=main_menu_kb(lang)
-    )
-    user_messages.setdefault(uid, []).append(msg.message_id)
-
+    await show_main_menu(callback.message.chat.id, uid, callback.message)
     await callback.answer()
 
 
 
-# ─────────────────── ОБРАБОТЧИК просмотра страниц ─────────────────
-@router.callback_query(F.data.startswith("browse:"))
-async def cb_browse_requests(callback: types.CallbackQuery):
-    try:
-        offset = int(callback.data.split(":")[1])
-    except (IndexError, ValueError):
-        offset = 0
-    await show_requests(callback.message.chat.id, callback.from_user.id, offset)
-    await callback.answer()
-
-
-@router.callback_query(F.data.startswith("cancel:"))
-async def cb_cancel(callback: types.CallbackQuery):
-    parts = callback.data.split(":")
-    if len(parts) < 2:
-        await callback.answer("Неверный формат", show_alert=True)
-        return
-
-    rid = int(parts[1])
-    back = parts[2] if len(parts) > 2 else None
+@callbacks.on(CancelCb)
+async def cb_cancel(callback: types.CallbackQuery, data: CancelCb):
+    rid, back = data.rid, data.back
     uid = callback.from_user.id
-    lang = get_lang(uid)
-
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute(
-            "SELECT reserved_by FROM requests WHERE id=?", (rid,)
-        ).fetchone()
+    lang = await get_lang(uid)
 
+    # ⚛️ Снимаем бронь только если она наша — одним условным UPDATE
+    if await try_cancel(rid, uid):
+        invalidate_pages()
+        await unschedule(rid)
+    else:
+        row = await db.fetchone("SELECT 1 FROM requests WHERE id=?", (rid,))
         if not row:
             await callback.answer(lang_text(lang, "Заявка не найдена", "Request not found"), show_alert=True)
-            return
-
-        if row[0] != uid:
+        else:
             await callback.answer(lang_text(lang, "Это не ваша заявка", "This is not your request"), show_alert=True)
-            return
-
-        con.execute(
-            "UPDATE requests SET reserved_by=NULL, reserved_until=NULL WHERE id=?",
-            (rid,)
-        )
-        con.commit()
+        return
 
     await callback.answer(lang_text(lang, "Бронь снята", "Reservation canceled"), show_alert=True)
 
     if back == "my":
-        await show_my_requests(callback.message.chat.id, uid)
-
-@router.callback_query(F.data.startswith("view:"))
-async def cb_view(callback: types.CallbackQuery):
-    try:
-        _, rid_str, offset = callback.data.split(":")
-        rid = int(rid_str)
-    except (ValueError, IndexError):
-        await callback.answer("Invalid ID", show_alert=True)
-        return
+        await show_my_requests(callback.message.chat.id, uid, edit_message=callback.message)
 
+@callbacks.on(ViewCb)
+async def cb_view(callback: types.CallbackQuery, data: ViewCb):
+    rid, offset = data.rid, data.token
     uid  = callback.from_user.id
-    lang = get_lang(uid)
+    lang = await get_lang(uid)
 
-    await delete_old_messages(bot, callback.message.chat.id, uid)
-
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute(
-            """SELECT shop_link, amount, note,
-                     reserved_by, reserved_until, created_at
-               FROM requests WHERE id=?""",
-            (rid,)
-        ).fetchone()
+    row = await db.fetchone(
+        """SELECT site, display_amount, note,
+                 reserved_by, reserved_until, date_full
+           FROM requests WHERE id=?""",
+        (rid,)
+    )
 
     if not row:
         await callback.answer(lang_text(lang,"Заявка не найдена","Request not found"), show_alert=True)
         return
 
-    shop, amount, note, reserved_by, reserved_until, created_at = row
-    text = generate_my_request_text(shop, amount, note, created_at, reserved_until)
+    site, amount, note, reserved_by, reserved_until, date_full = row
+    text = generate_my_request_text(site, amount, note, date_full, reserved_until)
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=lang_text(lang,"👥 Забронировать","👥 Reserve"),
-            callback_data=f"reserve:{rid}:{offset}"
+            callback_data=ReserveCb(rid=rid, back=offset).pack()
         )],
         [InlineKeyboardButton(
             text=lang_text(lang,"⬅️ Назад","⬅️ Back"),
-            callback_data=f"browse:{offset}"
+            callback_data=BrowseCb(token=offset).pack()
         )]
     ])
 
-    msg = await bot.send_message(callback.message.chat.id, text, reply_markup=kb)
-    user_messages.setdefault(uid, []).append(msg.message_id)
-
+    await render_screen(callback.message.chat.id, uid, text, kb, callback.message)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("page:"))
-async def cb_page(callback: types.CallbackQuery):
-    pass
-
 # ---------- бронь ----------
+# Все три операции — compare-and-set: условие и запись в одном UPDATE,
+# результат определяется по числу изменённых строк.
+async def try_reserve(rid: int, uid: int, until: datetime) -> bool:
+    """Бронирует заявку, если она свободна, бронь истекла или уже наша."""
+    return await db.execute(
+        """
+        UPDATE requests SET reserved_by=?, reserved_until=?
+        WHERE id=? AND (
+            reserved_by IS NULL OR reserved_by=?
+            OR reserved_until IS NULL OR reserved_until <= ?
+        )
+        """,
+        (uid, utc_iso(until), rid, uid, utc_iso(datetime.now(timezone.utc)))
+    ) == 1
+
+async def try_renew(rid: int, uid: int, until: datetime) -> bool:
+    return await db.execute(
+        "UPDATE requests SET reserved_until=? WHERE id=? AND reserved_by=?",
+        (utc_iso(until), rid, uid)
+    ) == 1
+
+async def try_cancel(rid: int, uid: int) -> bool:
+    return await db.execute(
+        "UPDATE requests SET reserved_by=NULL, reserved_until=NULL WHERE id=? AND reserved_by=?",
+        (rid, uid)
+    ) == 1
+
 # ================== CALLBACK HANDLERS ==================
 
-@router.callback_query(F.data.startswith("reserve:"))
-async def cb_reserve(callback: types.CallbackQuery):
-    print(f"✅ Reserve clicked: {callback.data}")
-    try:
-        _, rid_str, offset = callback.data.split(":")
-        rid = int(rid_str)
-    except (ValueError, IndexError):
-        print("❌ Failed to parse callback data")
-        await callback.answer("Invalid format", show_alert=True)
-        return
+@callbacks.on(ReserveCb)
+async def cb_reserve(callback: types.CallbackQuery, data: ReserveCb):
+    rid, offset = data.rid, data.back
 
     uid = callback.from_user.id
     until = datetime.now(timezone.utc) + timedelta(days=2)
-    print(f"ℹ️ Reserve for UID={uid}, RID={rid}, until={until}")
-
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute(
-            "SELECT reserved_by, reserved_until FROM requests WHERE id=?", (rid,)
-        ).fetchone()
-        print(f"📦 DB row: {row}")
-
-        if row and row[0] and row[0] != uid and row[1]:
-            reserved_until_dt = datetime.fromisoformat(row[1])
-            if reserved_until_dt.tzinfo is None:
-                reserved_until_dt = reserved_until_dt.replace(tzinfo=timezone.utc)
-
-            if reserved_until_dt > datetime.now(timezone.utc):
-                print("⛔ Already reserved by someone else")
-                await callback.answer(
-                    lang_text(get_lang(uid), "⛔ Уже забронирована", "⛔ Already reserved"),
-                    show_alert=True
-                )
-                return
 
-        print("🔁 Updating reservation in DB")
-        con.execute(
-            "UPDATE requests SET reserved_by=?, reserved_until=? WHERE id=?",
-            (uid, until.isoformat(), rid)
+    # ⚛️ Проверка и запись одним условным UPDATE: из одновременных нажатий выигрывает одно
+    if not await try_reserve(rid, uid, until):
+        logger.debug("⛔ RID=%s уже забронирована, UID=%s опоздал", rid, uid)
+        await callback.answer(
+            lang_text(await get_lang(uid), "⛔ Уже забронирована", "⛔ Already reserved"),
+            show_alert=True
         )
-        con.commit()
-
-    print("⏰ Scheduling release/reminder…")
-    schedule_release(rid, until)
-    schedule_reminder(rid, uid)
+        return
 
-    await callback.message.edit_reply_markup(reply_markup=None)
+    logger.info("📌 Бронь: UID=%s, RID=%s до %s", uid, rid, until.isoformat())
+    invalidate_pages()
+    await schedule_release(rid, until)
+    await schedule_reminder(rid, uid)
 
     await callback.answer(
-        lang_text(get_lang(uid), "✅ Забронировано на 48 ч", "✅ Reserved for 48 h"),
+        lang_text(await get_lang(uid), "✅ Забронировано на 48 ч", "✅ Reserved for 48 h"),
         show_alert=True
     )
 
     if offset == "my":
-        await show_my_requests(callback.message.chat.id, uid)
+        await show_my_requests(callback.message.chat.id, uid, edit_message=callback.message)
     else:
-        await show_requests(callback.message.chat.id, uid, int(offset))
-
-    print("✅ reserve handler завершился без ошибок")
+        await show_requests(callback.message.chat.id, uid, offset, callback.message)
 
 # ---------- продление ----------
-@router.callback_query(F.data.startswith("renew:"))
-async def cb_renew(callback: types.CallbackQuery):
-    print(f"♻️ Renew clicked: {callback.data}")
-    try:
-        _, rid_str, offset = callback.data.split(":")
-        rid = int(rid_str)
-    except (ValueError, IndexError):
-        print("❌ Failed to parse callback data")
-        await callback.answer("Invalid format", show_alert=True)
-        return
+@callbacks.on(RenewCb)
+async def cb_renew(callback: types.CallbackQuery, data: RenewCb):
+    rid, offset = data.rid, data.back
 
     uid = callback.from_user.id
     until = datetime.now(timezone.utc) + timedelta(days=2)
-    print(f"🔁 Renewing reservation UID={uid}, RID={rid}, until={until}")
-
-    with sqlite3.connect(DB_PATH) as con:
-        row = con.execute(
-            "SELECT reserved_by FROM requests WHERE id=?", (rid,)
-        ).fetchone()
-        if not row or row[0] != uid:
-            await callback.answer(
-                lang_text(get_lang(uid), "⛔ Вы не бронировали", "⛔ You didn't reserve this"),
-                show_alert=True
-            )
-            return
 
-        con.execute(
-            "UPDATE requests SET reserved_until=? WHERE id=?",
-            (until.isoformat(), rid)
+    if not await try_renew(rid, uid, until):
+        await callback.answer(
+            lang_text(await get_lang(uid), "⛔ Вы не бронировали", "⛔ You didn't reserve this"),
+            show_alert=True
         )
-        con.commit()
+        return
 
-    schedule_release(rid, until)
-    schedule_reminder(rid, uid)
+    logger.info("🔁 Бронь продлена: UID=%s, RID=%s до %s", uid, rid, until.isoformat())
+    invalidate_pages()
+    await schedule_release(rid, until)
+    await schedule_reminder(rid, uid)
 
     await callback.answer(
-        lang_text(get_lang(uid), "✅ Бронь продлена на 48 ч", "✅ Reservation extended for 48 h"),
+        lang_text(await get_lang(uid), "✅ Бронь продлена на 48 ч", "✅ Reservation extended for 48 h"),
         show_alert=True
     )
 
     if offset == "my":
-        await show_my_requests(callback.message.chat.id, uid)
+        await show_my_requests(callback.message.chat.id, uid, edit_message=callback.message)
     else:
-        await show_requests(callback.message.chat.id, uid, int(offset))
-
-    print("✅ renew handler завершился без ошибок")
+        await show_requests(callback.message.chat.id, uid, offset, callback.message)
 
 
 # ─────────────────── ОБРАБОТЧИК “Занято” ──────────────────────────
 # ───────── noop ─────────
-@router.callback_query(F.data == "noop")
+@callbacks.on("noop")
 async def cb_noop(cb: types.CallbackQuery):
-    lang = get_lang(cb.from_user.id)
+    lang = await get_lang(cb.from_user.id)
     await cb.answer(
         lang_text(lang, "⛔ Занято", "⛔ Busy"),
         show_alert=True
@@ -1103,30 +1264,14 @@ async def cb_noop(cb: types.CallbackQuery):
 
 # └───────────── ФУНКЦИЯ ПОКАЗА ГЛАВНОГО МЕНЮ ┐
 async def show_main_menu(chat_id: int, user_id: int, edit_message: types.Message | None = None):
-    lang = get_lang(user_id)
-
-    try:
-        if edit_message:
-            await edit_message.edit_text(
-                lang_text(lang, "✨ Главное меню:", "✨ Main menu:"),
-                reply_markup=main_menu_kb(lang)
-            )
-        else:
-            await delete_old_messages(bot, chat_id, user_id)
-            msg = await bot.send_message(
-                chat_id,
-                lang_text(lang, "✨ Главное меню:", "✨ Main menu:"),
-                reply_markup=main_menu_kb(lang)
-            )
-            user_messages.setdefault(user_id, []).append(msg.message_id)
-    except Exception:
-        await delete_old_messages(bot, chat_id, user_id)
-        msg = await bot.send_message(
-            chat_id,
-            lang_text(lang, "✨ Главное меню:", "✨ Main menu:"),
-            reply_markup=main_menu_kb(lang)
-        )
-        user_messages.setdefault(user_id, []).append(msg.message_id)
+    lang = await get_lang(user_id)
+    await render_screen(
+        chat_id,
+        user_id,
+        lang_text(lang, "✨ Главное меню:", "✨ Main menu:"),
+        main_menu_kb(lang),
+        edit_message
+    )
 
 
 # ————————— ОБРАБОТЧИК /start —————————
@@ -1144,10 +1289,9 @@ async def cmd_start(message: types.Message, state: FSMContext):
 # ————————— DEBUG CALLBACK (только для разработчика) —————————
 DEV_IDS = {517044272}  # ← сюда впиши свой Telegram ID
 
-@router.callback_query()
 async def debug_cb(cb: types.CallbackQuery):
     if cb.from_user.id in DEV_IDS:
-        print("📩 Callback data:", cb.data)
+        logger.info("📩 Callback data от разработчика: %s", cb.data)
         await cb.answer("📩 Debug callback", show_alert=True)
     else:
         # Не тревожим обычных пользователей
@@ -1155,24 +1299,61 @@ async def debug_cb(cb: types.CallbackQuery):
         await cb.answer()
 
 
+async def invalid_cb(cb: types.CallbackQuery):
+    await cb.answer(
+        lang_text(await get_lang(cb.from_user.id), "Неверный формат", "Invalid format"),
+        show_alert=True
+    )
+
+
+# ————————— ЕДИНАЯ ТОЧКА ВХОДА ДЛЯ CALLBACK-КНОПОК —————————
+callbacks.fallback = debug_cb
+callbacks.invalid = invalid_cb
+
+@router.callback_query()
+async def on_callback(callback: types.CallbackQuery, state: FSMContext):
+    await callbacks.dispatch(callback, state=state)
+
+
 # ================== MAIN ==================
 async def main():
     logger.info("⚙️ Запуск init_db()")
     init_db()
+    await preload_lang_cache()
 
     scheduler.start()
+    loop_lag.start()
+    metrics_server = await start_metrics_server(**METRICS) if METRICS["port"] else None
+    await outbox.start()
+    sweeper.start()  # первый проход сразу снимает всё, что истекло, пока бот был выключен
     scheduler.add_job(import_csv, trigger="interval", minutes=5, id="auto_import", replace_existing=True)
+    scheduler.add_job(prune_tracked_messages, trigger="interval", hours=1, id="prune_tracked_messages", replace_existing=True)
 
-    logger.info("🔧 Бот запускается...")
-    await bot.delete_webhook(drop_pending_updates=True)
+    logger.info("🔧 Бот запускается (%s)...", BOT_MODE)
+    if BOT_MODE != "webhook":
+        await bot.delete_webhook(drop_pending_updates=True)
 
     me = await bot.me()
     logger.info("🤖 Бот запущен как @%s", me.username)
 
     await import_csv()  # вручную подгружаем CSV
 
-    # ⬇️ ВАЖНО: запуск поллинга, чтобы бот начал слушать обновления
-    await dp.start_polling(bot)
+    # ⬇️ ВАЖНО: запуск поллинга или вебхука, чтобы бот начал слушать обновления
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, **WEBHOOK)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await sweeper.stop()
+        await outbox.stop()
+        await loop_lag.stop()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+        await cleaner.drain()
+        await dp.storage.close()
+        await remote.close()
+        db.close()
 
 # ⬇️ Этот блок ДОЛЖЕН БЫТЬ
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""Небольшие in-process кэши."""
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Словарь с ограниченным размером: при переполнении вытесняется давно не использованный ключ."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> V | None:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class VersionedCache(Generic[K, V]):
+    """
+    LRU-кэш, который целиком сбрасывается вызовом bump(): записи помнят версию,
+    при которой посчитаны, и после bump() считаются промахом. ttl (сек) — страховка
+    от изменений, о которых этот процесс не узнал (другой воркер, время).
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.ttl = ttl
+        self.version = 0
+        self._data: OrderedDict[K, tuple[int, float, V]] = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Сколько отрисовок не легло в кэш: пока считали, версия сменилась
+        self.stale = 0
+
+    def bump(self) -> None:
+        """Делает устаревшими все записи; память освобождается по мере вытеснения."""
+        self.version += 1
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is not None:
+            version, stored_at, value = entry
+            if version == self.version and (self.ttl is None or time.monotonic() - stored_at <= self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: K, value: V, version: int | None = None) -> None:
+        """
+        version — версия, прочитанная до того, как значение начали считать.
+        Если с тех пор был bump(), значение могло устареть — не сохраняем его.
+        """
+        if version is not None and version != self.version:
+            self.stale += 1
+            return
+        self._data[key] = (self.version, time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "version": self.version,
+        }
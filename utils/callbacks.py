@@ -0,0 +1,125 @@
+"""
+Схема callback_data кнопок и единая таблица их обработчиков.
+
+Фабрики CallbackData сохраняют прежний формат строк ("reserve:{rid}:{back}" и т.д.),
+поэтому кнопки в уже отправленных сообщениях продолжают работать.
+"""
+import inspect
+import logging
+import re
+from typing import Annotated, Any, Awaitable, Callable
+
+from aiogram import types
+from aiogram.filters.callback_data import CallbackData
+from pydantic import StringConstraints
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+
+# Курсор страницы: "{page}" или "{page}{n|p|a}{epoch}.{id}" (разбирает parse_page_token в bot.py)
+PAGE_TOKEN_RE = re.compile(r"(\d+)(?:([npa])(\d+)\.(\d+))?")
+# Неверный курсор отсекается ещё при распаковке — в CallbackTable.invalid, а не в обработчике
+PageToken = Annotated[str, StringConstraints(pattern=f"^{PAGE_TOKEN_RE.pattern}$")]
+# Куда вернуться после брони: курсор страницы или "my"
+BackTarget = Annotated[str, StringConstraints(pattern=f"^(?:my|{PAGE_TOKEN_RE.pattern})$")]
+
+
+class BrowseCb(CallbackData, prefix="browse"):
+    token: PageToken  # курсор страницы доступных заявок
+
+
+class ViewCb(CallbackData, prefix="view"):
+    rid: int
+    token: PageToken  # страница, на которую вернётся «Назад»
+
+
+class ReserveCb(CallbackData, prefix="reserve"):
+    rid: int
+    back: BackTarget
+
+
+class RenewCb(CallbackData, prefix="renew"):
+    rid: int
+    back: BackTarget
+
+
+class CancelCb(CallbackData, prefix="cancel"):
+    rid: int
+    back: BackTarget
+
+
+class MyRequestCb(CallbackData, prefix="my"):
+    rid: int
+    offset: int
+
+
+class MyBrowseCb(CallbackData, prefix="mybrowse"):
+    offset: int
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class CallbackTable:
+    """
+    Один обработчик callback-запросов на весь бот: префикс до первого ":"
+    (или вся строка для кнопок без данных) ищется в словаре, данные
+    распаковываются фабрикой и передаются обработчику. Стоимость не растёт
+    с числом обработчиков — в отличие от перебора фильтров F.data.startswith(...).
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, tuple[type[CallbackData] | None, Handler, frozenset[str]]] = {}
+        self.fallback: Handler | None = None
+        self.invalid: Handler | None = None
+
+    def on(self, key: type[CallbackData] | str) -> Callable[[Handler], Handler]:
+        """
+        Регистрирует обработчик для фабрики (handler(callback, data, ...)) или
+        точной строки без данных (handler(callback, ...)).
+        """
+        factory = None if isinstance(key, str) else key
+        name = key if factory is None else factory.__prefix__
+        if name in self._handlers:
+            raise ValueError(f"callback {name!r} is already registered")
+
+        def register(handler: Handler) -> Handler:
+            self._handlers[name] = (factory, handler, frozenset(inspect.signature(handler).parameters))
+            return handler
+
+        return register
+
+    def _lookup(self, data: str) -> tuple | None:
+        name, sep, _ = data.partition(SEPARATOR)
+        entry = self._handlers.get(name)
+        # Кнопке без данных лишний хвост не положен
+        if entry is None or (entry[0] is None and sep):
+            return None
+        return entry
+
+    def name(self, data: str | None) -> str:
+        """Имя обработчика, которому уйдёт callback_data (для метрик): конечный набор, а не сами данные."""
+        entry = self._lookup(data or "")
+        return entry[1].__name__ if entry is not None else "fallback"
+
+    async def dispatch(self, callback: types.CallbackQuery, **context: Any) -> Any:
+        data = callback.data or ""
+        entry = self._lookup(data)
+        if entry is None:
+            if self.fallback is not None:
+                return await self.fallback(callback)
+            return await callback.answer()
+
+        factory, handler, params = entry
+        args: tuple = (callback,)
+        if factory is not None:
+            try:
+                args = (callback, factory.unpack(data))
+            except (TypeError, ValueError):
+                logger.warning("⚠️ Неверные данные callback от UID=%s: %s", callback.from_user.id, data)
+                if self.invalid is not None:
+                    return await self.invalid(callback)
+                return await callback.answer()
+
+        return await handler(*args, **{k: v for k, v in context.items() if k in params})
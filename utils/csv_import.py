@@ -0,0 +1,125 @@
+"""Инкрементальное чтение CSV с заказами по водяной метке (watermark)."""
+import csv
+import hashlib
+import logging
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Watermark:
+    """Где закончился прошлый импорт: конец последней строки и её отпечаток."""
+    offset: int = 0
+    row_start: int = 0
+    fingerprint: str = ""
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def load_watermark(con: sqlite3.Connection, source: str) -> Watermark:
+    row = con.execute(
+        "SELECT offset, row_start, fingerprint FROM import_watermark WHERE source=?",
+        (source,)
+    ).fetchone()
+    return Watermark(*row) if row else Watermark()
+
+
+def save_watermark(con: sqlite3.Connection, source: str, wm: Watermark) -> None:
+    con.execute(
+        """
+        INSERT INTO import_watermark (source, offset, row_start, fingerprint, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(source) DO UPDATE SET
+            offset=excluded.offset,
+            row_start=excluded.row_start,
+            fingerprint=excluded.fingerprint,
+            updated_at=excluded.updated_at
+        """,
+        (source, wm.offset, wm.row_start, wm.fingerprint)
+    )
+
+
+def resume_offset(path: Path, wm: Watermark) -> int:
+    """
+    С какого байта продолжать чтение.
+    0 — если файл обрезан или переписан (отпечаток последней строки не совпал).
+    """
+    if wm.offset <= 0:
+        return 0
+    if path.stat().st_size < wm.offset:
+        return 0
+    with open(path, "rb") as f:
+        f.seek(wm.row_start)
+        last_row = f.read(wm.offset - wm.row_start)
+    if fingerprint(last_row) != wm.fingerprint:
+        return 0
+    return wm.offset
+
+
+class CsvTail:
+    """
+    Потоковое чтение CSV начиная с байта start: файл читается буферами,
+    строки разбираются по одной, в памяти не держится ни файл, ни список строк.
+    Недописанная последняя строка (без \\n) не читается — её подберёт следующий импорт.
+    Так же и запись, оборванная внутри многострочного поля в кавычках: строгий
+    csv.reader на конце файла падает, и метка остаётся перед этой записью.
+    """
+
+    def __init__(self, path: Path, start: int, fieldnames: list[str], buffering: int = 1 << 16):
+        self.path = path
+        self.start = start
+        self.fieldnames = fieldnames
+        self.buffering = buffering
+
+        # Позиция после последней отданной csv-модулю строки
+        self.offset = start
+        self.row_start = start
+        self._last_line = b""
+        self._eof = False
+        # То же для последней целиком разобранной записи — только это попадает в метку
+        self._done = (start, start, b"")
+
+    def __iter__(self) -> Iterator[dict]:
+        with open(self.path, "rb", buffering=self.buffering) as f:
+            f.seek(self.start)
+            reader = csv.DictReader(self._lines(f), fieldnames=self.fieldnames, strict=True)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    if self._eof:
+                        # Файл кончился посреди записи — дочитаем в следующий раз
+                        return
+                    # Битая запись в середине файла: пропускаем, метка уйдёт за неё со следующей
+                    logger.warning("⚠️ Пропущена битая строка CSV до байта %s: %s", self.offset, e)
+                    continue
+                self._done = (self.offset, self.row_start, self._last_line)
+                yield row
+
+    def _lines(self, f: BinaryIO) -> Iterator[str]:
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                self._eof = True
+                return
+            self.row_start = self.offset
+            self.offset += len(line)
+            self._last_line = line
+            yield line.decode("utf-8")
+
+    def watermark(self) -> Watermark:
+        """Метка после последней целиком разобранной записи (csv.reader не читает наперёд)."""
+        offset, row_start, last_line = self._done
+        return Watermark(
+            offset=offset,
+            row_start=row_start,
+            fingerprint=fingerprint(last_line),
+        )
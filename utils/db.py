@@ -0,0 +1,116 @@
+"""Асинхронный доступ к SQLite: запросы выполняются в отдельных потоках БД, а не в event loop."""
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Настройки на каждое подключение (journal_mode=WAL хранится в самом файле БД)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",       # ~16 МБ страничного кэша
+    "PRAGMA mmap_size=268435456",     # 256 МБ
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Размер кэша подготовленных выражений на подключение
+STATEMENT_CACHE = 256
+
+
+class Database:
+    """
+    Один поток-писатель и небольшой пул читателей, у каждого потока своё
+    долгоживущее подключение. В режиме WAL читатели (страницы заявок) не ждут
+    писателя (импорт, бронь) и не ловят "database is locked".
+    """
+
+    def __init__(self, path: Path, readers: int = 2):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # observe(kind, fn, секунды, исключение или None) — после каждого run/read (см. utils/metrics.py)
+        self.observe: Callable[[str, Callable, float, BaseException | None], None] | None = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Новое подключение с нужными PRAGMA."""
+        con = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE, check_same_thread=False)
+        for pragma in PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = self.connect()
+            with self._connections_lock:
+                self._connections.append(con)
+        return con
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Выполняет fn(con, *args) в потоке-писателе: коммит при успехе, откат при ошибке."""
+        return await self._submit("write", self._writer, self._write, fn, args)
+
+    async def read(self, fn: Callable[..., T], *args: Any) -> T:
+        """Выполняет fn(con, *args) только на чтение в пуле читателей."""
+        return await self._submit("read", self._readers, self._read, fn, args)
+
+    async def _submit(self, kind: str, executor: ThreadPoolExecutor, call: Callable, fn: Callable, args: tuple) -> Any:
+        loop = asyncio.get_running_loop()
+        if self.observe is None:
+            return await loop.run_in_executor(executor, call, fn, args)
+        # Время вместе с ожиданием свободного потока — именно его видит обработчик
+        started = time.perf_counter()
+        error = None
+        try:
+            return await loop.run_in_executor(executor, call, fn, args)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.observe(kind, fn, time.perf_counter() - started, error)
+
+    def _write(self, fn: Callable[..., T], args: tuple) -> T:
+        con = self._thread_connection()
+        try:
+            result = fn(con, *args)
+            con.commit()
+            return result
+        except BaseException:
+            con.rollback()
+            raise
+
+    def _read(self, fn: Callable[..., T], args: tuple) -> T:
+        return fn(self._thread_connection(), *args)
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> tuple | None:
+        def fetchone(con: sqlite3.Connection) -> tuple | None:
+            return con.execute(sql, params).fetchone()
+        return await self.read(fetchone)
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list[tuple]:
+        def fetchall(con: sqlite3.Connection) -> list[tuple]:
+            return con.execute(sql, params).fetchall()
+        return await self.read(fetchall)
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Выполняет запрос на запись, возвращает число затронутых строк."""
+        # Именованные функции вместо lambda — по имени fn они различаются в метриках
+        def execute(con: sqlite3.Connection) -> int:
+            return con.execute(sql, params).rowcount
+        return await self.run(execute)
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
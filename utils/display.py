@@ -0,0 +1,78 @@
+"""
+Готовые к показу поля заявки. Считаются один раз — при импорте (и бэкфилле
+миграцией), а экраны только склеивают строки из колонок requests.
+"""
+import re
+import sqlite3
+from datetime import datetime
+
+# Колонки requests в порядке, в котором их возвращает display_columns()
+DISPLAY_COLUMNS = ("title", "site", "display_amount", "amount_cents", "date_ru", "date_en", "date_full")
+
+AMOUNT_RE = re.compile(r"(?:(\d+)\s*\*\s*)?[$€]?(\d+(?:[.,]\d{1,2})?)[$€]?")
+
+
+def format_shop_title(shop_link: str) -> str:
+    parts = shop_link.replace("www.", "").split(".")
+    return parts[0].capitalize() if parts else shop_link.capitalize()
+
+
+def shop_site(shop_link: str) -> str:
+    """Домен для карточки заявки: без www, с .com, если зоны нет."""
+    domain = shop_link.replace("www.", "")
+    if "." not in domain:
+        domain += ".com"
+    return domain
+
+
+def display_amount(amount: str) -> str:
+    return amount if "$" in amount else f"${amount}"
+
+
+def amount_cents(amount: str) -> int | None:
+    """Сумма в центах: "$100" -> 10000, "2 * $50" -> 10000. None, если не разобрать."""
+    m = AMOUNT_RE.fullmatch(amount.strip())
+    if not m:
+        return None
+    count, value = m.groups()
+    cents = round(float(value.replace(",", ".")) * 100)
+    return cents * int(count) if count else cents
+
+
+def short_date(created_at: str, lang: str = "ru") -> str:
+    try:
+        dt = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        return "??.??"
+    return dt.strftime("%d.%m") if lang == "ru" else dt.strftime("%b %d")  # Jul 04
+
+
+def full_date(created_at: str) -> str:
+    try:
+        return datetime.fromisoformat(created_at).strftime("%d.%m.%Y %H:%M")
+    except (TypeError, ValueError):
+        return ""
+
+
+def display_columns(shop_link: str, amount: str, created_at: str) -> tuple:
+    """Значения DISPLAY_COLUMNS для одной заявки."""
+    return (
+        format_shop_title(shop_link),
+        shop_site(shop_link),
+        display_amount(amount),
+        amount_cents(amount),
+        short_date(created_at, "ru"),
+        short_date(created_at, "en"),
+        full_date(created_at),
+    )
+
+
+def backfill_display_columns(con: sqlite3.Connection, batch: int = 5000) -> None:
+    """Заполняет DISPLAY_COLUMNS у уже существующих заявок (для миграции)."""
+    assignments = ", ".join(f"{column}=?" for column in DISPLAY_COLUMNS)
+    cur = con.execute("SELECT id, shop_link, amount, created_at FROM requests")
+    while rows := cur.fetchmany(batch):
+        con.executemany(
+            f"UPDATE requests SET {assignments} WHERE id=?",
+            [(*display_columns(shop, amount, created_at), rid) for rid, shop, amount, created_at in rows],
+        )
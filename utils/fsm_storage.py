@@ -0,0 +1,203 @@
+"""FSM-хранилище aiogram поверх SQLite бота: кэш в памяти и отложенная пакетная запись."""
+import asyncio
+import copy
+import json
+import logging
+import os
+import socket
+import sqlite3
+from typing import Any, Callable, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from utils.cache import LRUCache
+from utils.db import Database
+
+logger = logging.getLogger(__name__)
+
+# (state, data) одной записи
+Record = tuple[str | None, dict[str, Any]]
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Состояния и данные FSM в таблице fsm_storage.
+
+    Чтение идёт из кэша в памяти (в БД — только при первом обращении к ключу),
+    запись — сразу в кэш, а в БД пачкой раз в flush_interval секунд одной
+    транзакцией. При падении процесса теряются изменения последних flush_interval секунд.
+
+    Несколько воркеров на одной БД: каждая пачка получает номер ревизии из
+    fsm_revision, и при каждом сбросе воркер забирает чужие записи новее
+    последней увиденной ревизии и выкидывает их ключи из своего кэша.
+    Чужое изменение становится видно не позже чем через flush_interval.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        key_builder: KeyBuilder | None = None,
+        cache_size: int = 50_000,
+        flush_interval: float = 0.2,
+        json_dumps: Callable[..., str] = json.dumps,
+        json_loads: Callable[..., Any] = json.loads,
+    ):
+        self.db = db
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.flush_interval = flush_interval
+        self.json_dumps = json_dumps
+        self.json_loads = json_loads
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._cache: LRUCache[str, Record] = LRUCache(cache_size)
+        self._dirty: dict[str, Record] = {}
+        # Последняя увиденная ревизия; None — ещё ни разу не синхронизировались
+        self._revision: int | None = None
+        self._task: asyncio.Task | None = None
+        self._closed = False
+
+        self.stats = {"loads": 0, "flushes": 0, "written": 0, "invalidated": 0}
+
+    # ──────────── BaseStorage ────────────
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        _, data = await self._record(k)
+        self._write(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._record(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        state, _ = await self._record(k)
+        self._write(k, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._record(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        """Останавливает фоновую запись и сбрасывает всё, что ещё не записано."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # ──────────── кэш и запись ────────────
+    async def _record(self, k: str) -> Record:
+        self._ensure_flusher()
+        record = self._dirty.get(k) or self._cache.get(k)
+        if record is None:
+            self.stats["loads"] += 1
+            revision, row = await self.db.read(_load, k)
+            if self._revision is None:
+                self._revision = revision
+            record = (row[0], self.json_loads(row[1])) if row else (None, {})
+            # Пока грузили, ключ могли записать — запись новее
+            record = self._dirty.get(k) or record
+            self._cache.set(k, record)
+        return record
+
+    def _write(self, k: str, state: str | None, data: dict[str, Any]) -> None:
+        record = (state, data)
+        self._cache.set(k, record)
+        self._dirty[k] = record
+        self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        # Запускаем лениво: при создании хранилища event loop ещё нет
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Ошибка записи FSM в БД")
+
+    async def flush(self) -> None:
+        """
+        Пишет накопленные изменения одной транзакцией и подтягивает чужие.
+        Если писать нечего, чужие изменения проверяются в пуле читателей —
+        поток-писатель остаётся брони и импорту.
+        """
+        batch, self._dirty = self._dirty, {}
+        if not batch:
+            if self._revision is not None:
+                revision, changed = await self.db.read(_sync, self.worker, self._revision)
+                self._merge(revision, changed)
+            return
+
+        rows = [(k, state, self.json_dumps(data)) for k, (state, data) in batch.items()]
+        try:
+            revision, changed = await self.db.run(_flush, rows, self.worker, self._revision)
+        except BaseException:
+            # Не потеряем: вернём в очередь, если ключ не успели переписать
+            for k, record in batch.items():
+                self._dirty.setdefault(k, record)
+            raise
+
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(rows)
+        self._merge(revision, changed)
+
+    def _merge(self, revision: int, changed: list[str]) -> None:
+        self._revision = revision if self._revision is None else max(self._revision, revision)
+        for k in changed:
+            if k not in self._dirty and self._cache.pop(k) is not None:
+                self.stats["invalidated"] += 1
+
+
+def _load(con: sqlite3.Connection, k: str) -> tuple[int, tuple[str | None, str] | None]:
+    """(текущая ревизия, запись). Ревизия читается первой: всё, что запишут после, поймает синхронизация."""
+    revision = con.execute("SELECT rev FROM fsm_revision WHERE id = 1").fetchone()[0]
+    return revision, con.execute("SELECT state, data FROM fsm_storage WHERE key=?", (k,)).fetchone()
+
+
+def _flush(
+    con: sqlite3.Connection, rows: list[tuple], worker: str, seen: int | None
+) -> tuple[int, list[str]]:
+    """
+    Пишет rows под новой ревизией. Возвращает (последняя ревизия, ключи,
+    изменённые другими воркерами после seen). При seen=None только запоминаем
+    ревизию: из БД ещё ничего не читали, сбрасывать нечего.
+    """
+    # Первым — запись: сразу берём блокировку на запись, ревизии идут строго по порядку
+    revision = con.execute(
+        "UPDATE fsm_revision SET rev = rev + 1 WHERE id = 1 RETURNING rev"
+    ).fetchone()[0]
+    con.executemany(
+        """
+        INSERT INTO fsm_storage (key, state, data, rev, worker) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            state=excluded.state, data=excluded.data, rev=excluded.rev, worker=excluded.worker
+        """,
+        [(k, state, data, revision, worker) for k, state, data in rows]
+    )
+    return revision, [] if seen is None else _changed(con, worker, seen)
+
+
+def _sync(con: sqlite3.Connection, worker: str, seen: int) -> tuple[int, list[str]]:
+    """То же без записи — только на чтение: (последняя ревизия, чужие ключи новее seen)."""
+    revision = con.execute("SELECT rev FROM fsm_revision WHERE id = 1").fetchone()[0]
+    if revision <= seen:
+        return revision, []
+    return revision, _changed(con, worker, seen)
+
+
+def _changed(con: sqlite3.Connection, worker: str, seen: int) -> list[str]:
+    return [
+        k for (k,) in con.execute(
+            "SELECT key FROM fsm_storage WHERE rev > ? AND worker != ?", (seen, worker)
+        )
+    ]
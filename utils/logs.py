@@ -0,0 +1,163 @@
+"""
+Неблокирующее логирование: записи уходят в очередь, в файл и консоль их
+пишет отдельный поток QueueListener. Файл — JSON по строке на запись с ротацией по размеру.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Mapping
+
+# Атрибуты LogRecord, которые не считаются «дополнительными полями»
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: ts, level, logger, msg, поля из extra=..., exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "src": f"{record.module}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше burst записей за interval секунд с одного места в коде
+    (файл + строка) для уровней до max_level включительно; ошибки проходят всегда.
+    Сколько записей пропущено, видно в поле suppressed следующей пропущенной дальше.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 10.0, max_level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_level = max_level
+        # (pathname, lineno) -> [начало окна, записей в окне, пропущено]
+        self._sites: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                suppressed = 0
+            else:
+                site[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладёт запись в ограниченную очередь и никогда не ждёт: если поток записи
+    не успевает, запись выбрасывается (счётчик dropped уходит со следующей).
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от базового класса не склеиваем traceback с текстом —
+        # в JSON он идёт отдельным полем
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = _exception_formatter.formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> dict[str, str]:
+    """"aiogram.event=WARNING,apscheduler=WARNING" -> {"aiogram.event": "WARNING", ...}"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    path: str = "bot_logs.log",
+    level: str | int = logging.INFO,
+    levels: Mapping[str, str | int] | None = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backups: int = 5,
+    queue_size: int = 10_000,
+    console: bool = True,
+    rate_limit: RateLimitFilter | None = None,
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер: он только кладёт записи в очередь, файл
+    (JSON, ротация по max_bytes) и консоль (текст) пишет фоновый поток.
+    levels — уровни отдельных логгеров, например {"aiogram.event": "WARNING"}.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers: list[logging.Handler] = [file_handler]
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        handlers.append(stream)
+
+    q: queue.Queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(q)
+    queue_handler.addFilter(rate_limit or RateLimitFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописать хвост очереди при выходе
+    atexit.register(listener.stop)
+    return listener
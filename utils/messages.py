@@ -0,0 +1,183 @@
+"""Учёт и удаление служебных сообщений бота (прошлых экранов меню)."""
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from utils.db import Database
+
+logger = logging.getLogger(__name__)
+
+# deleteMessages принимает до 100 id за вызов
+DELETE_BATCH = 100
+# Сколько одиночных deleteMessage держим в полёте, если пачкой не вышло
+DELETE_CONCURRENCY = 8
+# Бот не может удалять сообщения старше 48 часов — хранить их id дольше незачем
+MESSAGE_TTL = timedelta(hours=48)
+
+
+def _chunks(ids: Iterable[int], size: int) -> Iterable[list[int]]:
+    it = iter(ids)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+async def delete_messages(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """
+    Удаляет сообщения пачками по DELETE_BATCH через deleteMessages.
+    Если пачка не прошла — удаляет её по одному с ограниченной параллельностью.
+    Уже удалённые и слишком старые сообщения просто пропускаются.
+    """
+    for chunk in _chunks(message_ids, DELETE_BATCH):
+        try:
+            await bot.delete_messages(chat_id, chunk)
+        except TelegramAPIError as e:
+            logger.debug("deleteMessages для %s не прошёл (%s), удаляем по одному", chat_id, e)
+            await _delete_one_by_one(bot, chat_id, chunk)
+
+
+async def _delete_one_by_one(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    sem = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+    async def delete(msg_id: int) -> None:
+        async with sem:
+            try:
+                await bot.delete_message(chat_id, msg_id)
+            except TelegramAPIError:
+                pass  # например, сообщение уже удалено
+
+    await asyncio.gather(*(delete(msg_id) for msg_id in message_ids))
+
+
+class BackgroundCleaner:
+    """Фоновое удаление: экран отправляется сразу, старые сообщения исчезают следом."""
+
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+
+    def schedule(self, bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+        if not message_ids:
+            return
+        task = asyncio.create_task(self._run(bot, chat_id, message_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+        try:
+            await delete_messages(bot, chat_id, message_ids)
+        except Exception:
+            logger.exception("❌ Ошибка удаления сообщений в чате %s", chat_id)
+
+    async def drain(self) -> None:
+        """Дожидается всех начатых удалений (при остановке бота)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+class MessageTracker:
+    """
+    Id экранов, которые бот показал пользователю, чтобы потом их убрать.
+    На пользователя хранится не больше per_user последних id, всё старше ttl
+    выбрасывается. С db записи лежат в таблице tracked_messages: переживают
+    рестарт и общие для нескольких воркеров на одной БД. Без db — в памяти,
+    не больше max_users пользователей (давно неактивные вытесняются первыми).
+    """
+
+    def __init__(
+        self,
+        db: Database | None = None,
+        per_user: int = 20,
+        ttl: timedelta = MESSAGE_TTL,
+        max_users: int = 50_000,
+    ):
+        self.db = db
+        self.per_user = per_user
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> (время последней записи, id сообщений); порядок — от давно неактивных
+        self._memory: OrderedDict[int, tuple[float, list[int]]] = OrderedDict()
+
+    async def add(self, user_id: int, message_id: int) -> None:
+        if self.db is not None:
+            await self.db.run(_add, user_id, message_id, _utc_now(), self.per_user)
+            return
+
+        _, ids = self._memory.pop(user_id, (0.0, []))
+        ids.append(message_id)
+        del ids[:-self.per_user]
+        self._memory[user_id] = (time.time(), ids)
+        while len(self._memory) > self.max_users:
+            self._memory.popitem(last=False)
+
+    async def take(self, user_id: int) -> list[int]:
+        """Забирает (и забывает) id всех ещё удаляемых сообщений пользователя."""
+        if self.db is not None:
+            cutoff = _utc_now(-self.ttl)
+            return await self.db.run(_take, user_id, cutoff)
+
+        touched, ids = self._memory.pop(user_id, (0.0, []))
+        if time.time() - touched > self.ttl.total_seconds():
+            return []
+        return ids
+
+    async def prune(self) -> int:
+        """Выбрасывает записи старше ttl, возвращает сколько удалено."""
+        if self.db is not None:
+            return await self.db.run(_prune, _utc_now(-self.ttl))
+
+        cutoff = time.time() - self.ttl.total_seconds()
+        removed = 0
+        while self._memory:
+            user_id, (touched, _) = next(iter(self._memory.items()))
+            if touched > cutoff:
+                break
+            del self._memory[user_id]
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+
+def _utc_now(delta: timedelta = timedelta()) -> str:
+    return (datetime.now(timezone.utc) + delta).isoformat(timespec="seconds")
+
+
+def _add(con: sqlite3.Connection, user_id: int, message_id: int, now: str, per_user: int) -> None:
+    con.execute(
+        "INSERT OR REPLACE INTO tracked_messages (user_id, message_id, created_at) VALUES (?, ?, ?)",
+        (user_id, message_id, now)
+    )
+    # id сообщений в чате растут, так что последние per_user — это самые большие
+    con.execute(
+        """
+        DELETE FROM tracked_messages
+        WHERE user_id = ?1 AND message_id < (
+            SELECT MIN(message_id) FROM (
+                SELECT message_id FROM tracked_messages
+                WHERE user_id = ?1 ORDER BY message_id DESC LIMIT ?2
+            )
+        )
+        """,
+        (user_id, per_user)
+    )
+
+
+def _take(con: sqlite3.Connection, user_id: int, cutoff: str) -> list[int]:
+    # DELETE ... RETURNING атомарен: два воркера не получат одни и те же id
+    rows = con.execute(
+        "DELETE FROM tracked_messages WHERE user_id = ? RETURNING message_id, created_at",
+        (user_id,)
+    ).fetchall()
+    return sorted(message_id for message_id, created_at in rows if created_at > cutoff)
+
+
+def _prune(con: sqlite3.Connection, cutoff: str) -> int:
+    return con.execute("DELETE FROM tracked_messages WHERE created_at <= ?", (cutoff,)).rowcount
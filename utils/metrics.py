@@ -0,0 +1,326 @@
+"""
+Метрики бота в текстовом формате Prometheus: гистограммы задержек обработчиков,
+запросов к БД и Bot API, лаг event loop, счётчики задач планировщика и этапов импорта.
+
+Без внешних зависимостей: запись метрики — поиск в словаре и пара сложений,
+поэтому инструментирование включено всегда. Отдаёт их встроенный aiohttp-сервер.
+"""
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Секунды: от миллисекунды до десятка секунд
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Этапы импорта CSV заметно дольше
+IMPORT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # Пишут и event loop, и рабочие потоки (импорт) — без блокировки счётчики бы терялись
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class Gauge(_Metric):
+    """Текущее значение: задаётся set() или читается из fn() при каждом запросе метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float] | None = None):
+        super().__init__(name, help)
+        self.fn = fn
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def render(self) -> list[str]:
+        value = self.fn() if self.fn is not None else self._value
+        return self.header() + [f"{self.name} {_number(value)}"]
+
+
+class FnCounter(Gauge):
+    """Счётчик, который ведёт кто-то другой (например, hits кэша): значение читается из fn()."""
+
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: Any) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def total(self, *labels: Any) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        lines = self.header()
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = 'le="%s"' % (bound if isinstance(bound, str) else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name!r} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float] | None = None) -> Gauge:
+        return self._add(Gauge(name, help, fn))
+
+    def counter_fn(self, name: str, help: str, fn: Callable[[], float]) -> FnCounter:
+        return self._add(FnCounter(name, help, fn))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Время обработчика апдейта", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler", "error"))
+DB_SECONDS = REGISTRY.histogram("bot_db_seconds", "Запрос к БД с ожиданием потока", ("kind", "fn"))
+DB_ERRORS = REGISTRY.counter("bot_db_errors_total", "Ошибки запросов к БД", ("kind", "fn", "error"))
+API_SECONDS = REGISTRY.histogram("bot_api_seconds", "Вызов Bot API", ("method",))
+API_ERRORS = REGISTRY.counter("bot_api_errors_total", "Ошибки вызовов Bot API", ("method", "error"))
+LOOP_LAG = REGISTRY.histogram("bot_event_loop_lag_seconds", "Опоздание event loop")
+JOBS = REGISTRY.counter("bot_scheduler_jobs_total", "Запуски фоновых задач", ("job", "status"))
+IMPORT_SECONDS = REGISTRY.histogram(
+    "bot_import_phase_seconds", "Этапы импорта CSV", ("phase",), buckets=IMPORT_BUCKETS
+)
+IMPORT_ROWS = REGISTRY.counter("bot_import_rows_total", "Строки CSV по итогу импорта", ("result",))
+
+
+# ──────────── точки инструментирования ────────────
+class HandlerMetrics(BaseMiddleware):
+    """
+    Внутренний middleware роутера: время и ошибки каждого обработчика.
+    label(event, data) — имя для метки handler (по умолчанию имя функции-обработчика).
+    """
+
+    def __init__(self, label: Callable[[Any, dict], str] | None = None):
+        self.label = label
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event: Any, data: dict) -> Any:
+        name = self.label(event, data) if self.label else data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки каждого метода Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def observe_db(kind: str, fn: Callable, elapsed: float, error: BaseException | None) -> None:
+    """Хук Database.observe."""
+    name = getattr(fn, "__name__", "?")
+    DB_SECONDS.observe(elapsed, kind, name)
+    if error is not None:
+        DB_ERRORS.inc(kind, name, type(error).__name__)
+
+
+def counted_job(name: str, job: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Обёртка фоновой задачи: считает запуски (ok / error) в bot_scheduler_jobs_total."""
+
+    @wraps(job)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            result = await job(*args, **kwargs)
+        except Exception:
+            JOBS.inc(name, "error")
+            raise
+        JOBS.inc(name, "ok")
+        return result
+
+    return wrapper
+
+
+def watch_scheduler(scheduler) -> None:
+    """Считает выполненные, упавшие и пропущенные задачи APScheduler."""
+    from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
+
+    statuses = {EVENT_JOB_EXECUTED: "ok", EVENT_JOB_ERROR: "error", EVENT_JOB_MISSED: "missed"}
+    scheduler.add_listener(
+        lambda event: JOBS.inc(event.job_id, statuses[event.code]),
+        EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED,
+    )
+
+
+def watch_cache(name: str, cache: Any, registry: Registry = REGISTRY) -> None:
+    """
+    Размер и счётчики кэша (LRUCache, VersionedCache из utils/cache.py):
+    bot_<name>_cache_entries, _hits_total, _misses_total и, если есть, _stale_total.
+    """
+    registry.gauge(f"bot_{name}_cache_entries", f"Записей в кэше {name}", lambda: len(cache))
+    for stat in ("hits", "misses", "stale"):
+        if stat in cache.stats():
+            registry.counter_fn(
+                f"bot_{name}_cache_{stat}_total", f"{stat} кэша {name}", lambda stat=stat: getattr(cache, stat)
+            )
+
+
+class LoopLagMonitor:
+    """Раз в interval секунд засыпает и меряет, насколько позже положенного проснулся."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, time.perf_counter() - started - self.interval))
+
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """GET /metrics в текстовом формате Prometheus."""
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("📈 Метрики: http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,207 @@
+"""Версионированные миграции схемы БД (номер версии хранится в PRAGMA user_version)."""
+import logging
+import sqlite3
+from typing import Callable
+
+from utils.display import DISPLAY_COLUMNS, backfill_display_columns
+
+logger = logging.getLogger(__name__)
+
+
+def add_display_columns(con: sqlite3.Connection) -> None:
+    # Не executescript(): он коммитит открытую транзакцию
+    for column in DISPLAY_COLUMNS:
+        column_type = "INTEGER" if column == "amount_cents" else "TEXT"
+        con.execute(f"ALTER TABLE requests ADD COLUMN {column} {column_type}")
+    backfill_display_columns(con)
+
+
+def run_statements(con: sqlite3.Connection, script: str) -> None:
+    """Выполняет SQL-скрипт по одному выражению внутри уже открытой транзакции (в отличие от executescript)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            con.execute(statement)
+            statement = ""
+    if statement.strip():
+        con.execute(statement)
+
+
+def dedupe_requests(con: sqlite3.Connection) -> None:
+    """
+    Оставляет по одной заявке на (shop_link, amount, note, created_at) и
+    создаёт UNIQUE-индекс. Из дублей остаётся самая ранняя забронированная копия,
+    иначе самая ранняя. Забронированные дубли тоже удаляются (иначе индекс не
+    создать) — каждая такая снятая бронь пишется в лог.
+    """
+    keep = """
+        SELECT COALESCE(MIN(CASE WHEN reserved_by IS NOT NULL THEN id END), MIN(id)) AS id,
+               shop_link, amount, note, created_at
+        FROM requests
+        GROUP BY shop_link, amount, note, created_at
+    """
+    released = con.execute(
+        f"""
+        SELECT r.id, r.reserved_by, k.id
+        FROM requests r
+        JOIN ({keep}) k
+          ON k.shop_link IS r.shop_link AND k.amount IS r.amount
+         AND k.note IS r.note AND k.created_at IS r.created_at
+        WHERE r.reserved_by IS NOT NULL AND r.id != k.id
+        """
+    ).fetchall()
+    for rid, uid, kept in released:
+        logger.warning("⚠️ Дубль заявки RID=%s (бронь UID=%s) удалён, оставлена RID=%s", rid, uid, kept)
+
+    con.execute(f"DELETE FROM requests WHERE id NOT IN (SELECT id FROM ({keep}))")
+    con.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_requests_dedupe ON requests (shop_link, amount, note, created_at)"
+    )
+
+
+def base_schema(con: sqlite3.Connection) -> None:
+    run_statements(con, '''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_link TEXT NOT NULL,
+            amount TEXT NOT NULL,
+            note TEXT,
+            reserved_by INTEGER,
+            reserved_until TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            lang TEXT DEFAULT 'ru'
+        );
+        CREATE TABLE IF NOT EXISTS import_watermark (
+            source TEXT PRIMARY KEY,
+            offset INTEGER NOT NULL,
+            row_start INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            updated_at TEXT
+        );
+    ''')
+    # 🧾 Дедупликация импорта: сначала чистим старые дубли
+    dedupe_requests(con)
+
+
+def utc_timestamps(con: sqlite3.Connection) -> None:
+    # Наивные строки считаем UTC, со смещением — переводим в UTC.
+    # Формат 'YYYY-MM-DDTHH:MM:SS+00:00' сравнивается и сортируется как строка,
+    # поэтому фильтры и ORDER BY по created_at идут по индексу без datetime().
+    run_statements(con, '''
+        DROP INDEX IF EXISTS idx_requests_dedupe;
+
+        UPDATE requests
+        SET created_at = COALESCE(strftime('%Y-%m-%dT%H:%M:%S+00:00', created_at), created_at);
+        UPDATE requests
+        SET reserved_until = COALESCE(strftime('%Y-%m-%dT%H:%M:%S+00:00', reserved_until), reserved_until)
+        WHERE reserved_until IS NOT NULL;
+    ''')
+    # После нормализации разные записи одного времени совпадают — в том числе забронированные
+    dedupe_requests(con)
+    run_statements(con, '''
+        CREATE INDEX idx_requests_created ON requests (created_at);
+        CREATE INDEX idx_requests_reserved_by ON requests (reserved_by, created_at);
+    ''')
+
+
+# (версия, описание, SQL или функция(con)). Уже применённые миграции не меняем — только добавляем новые.
+MIGRATIONS: list[tuple[int, str, str | Callable[[sqlite3.Connection], None]]] = [
+    (1, "базовая схема", base_schema),
+    (2, "UTC-время в едином ISO-формате и индексы для списков", utc_timestamps),
+    (3, "покрывающий индекс для keyset-пагинации доступных заявок", '''
+        -- (created_at, id) — ключ курсора; reserved_by/reserved_until — чтобы
+        -- условие доступности проверялось прямо в индексе, без чтения таблицы
+        DROP INDEX IF EXISTS idx_requests_created;
+        CREATE INDEX idx_requests_browse
+            ON requests (created_at, id, reserved_by, reserved_until);
+    '''),
+    (4, "постоянное хранилище заданий по броням", '''
+        CREATE TABLE scheduled_jobs (
+            job_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            rid INTEGER NOT NULL,
+            uid INTEGER,
+            run_at TEXT NOT NULL
+        );
+        CREATE INDEX idx_scheduled_jobs_run_at ON scheduled_jobs (run_at);
+        CREATE INDEX idx_scheduled_jobs_rid ON scheduled_jobs (rid);
+
+        -- Таймеры освобождения для броней, сделанных до миграции
+        INSERT INTO scheduled_jobs (job_id, kind, rid, uid, run_at)
+        SELECT 'release_' || id, 'release', id, reserved_by, reserved_until
+        FROM requests
+        WHERE reserved_by IS NOT NULL AND reserved_until IS NOT NULL;
+    '''),
+    (5, "снятие броней одним подметальщиком по индексу reserved_until", '''
+        -- Сроки освобождения берутся прямо из requests, отдельные задания не нужны
+        DELETE FROM scheduled_jobs WHERE kind = 'release';
+        CREATE INDEX idx_requests_reserved_until
+            ON requests (reserved_until) WHERE reserved_by IS NOT NULL;
+    '''),
+    (6, "очередь исходящих сообщений", '''
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        );
+    '''),
+    (7, "учёт отправленных экранов меню", '''
+        CREATE TABLE tracked_messages (
+            user_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, message_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX idx_tracked_messages_created ON tracked_messages (created_at);
+    '''),
+    (8, "готовые к показу колонки заявок", add_display_columns),
+    (9, "хранилище FSM", '''
+        CREATE TABLE fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            rev INTEGER NOT NULL,
+            worker TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX idx_fsm_storage_rev ON fsm_storage (rev);
+
+        -- Счётчик ревизий: у каждой пачки записей свой номер
+        CREATE TABLE fsm_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            rev INTEGER NOT NULL
+        );
+        INSERT INTO fsm_revision (id, rev) VALUES (1, 0);
+    '''),
+]
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции, каждую в своей транзакции. Возвращает итоговую версию."""
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+
+    for target, description, step in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info("🗄 Миграция БД %s: %s", target, description)
+        try:
+            if callable(step):
+                # executescript() сам не открывает транзакцию, поэтому BEGIN явный
+                con.execute("BEGIN")
+                step(con)
+                con.execute(f"PRAGMA user_version={target}")
+                con.commit()
+            else:
+                con.executescript(f"BEGIN;\n{step}\nPRAGMA user_version={target};\nCOMMIT;")
+        except sqlite3.Error:
+            if con.in_transaction:
+                con.rollback()
+            raise
+        version = target
+
+    return version
@@ -0,0 +1,219 @@
+"""Очередь исходящих сообщений бота с учётом лимитов Telegram."""
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from utils.cache import LRUCache
+from utils.db import Database
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота и ~1 в секунду в один чат.
+# Идём с запасом: за любую секунду уходит не больше GLOBAL_RATE + GLOBAL_BURST = 25,
+# в один чат — не чаще раза в 1.25 с (запас на разброс задержек сети).
+GLOBAL_RATE = 20.0
+GLOBAL_BURST = 5
+PER_CHAT_RATE = 0.8
+# 429 сразу в стольких разных чатах за FLOOD_WINDOW секунд — значит, флуд на весь бот
+GLOBAL_FLOOD_CHATS = 3
+FLOOD_WINDOW = 1.0
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # До этого момента ведро закрыто (RetryAfter от Telegram)
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Забирает токен (в долг, если надо) и возвращает, сколько секунд ждать до него."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def settle(self) -> None:
+        """
+        Отсчитывает следующий токен от текущего момента, а не от резерва: зовётся,
+        когда пришёл ответ, — запрос к этому времени точно дошёл до сервера.
+        """
+        now = time.monotonic()
+        self.tokens = min(0.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class Outbox:
+    """
+    Все сообщения, которые бот шлёт сам (напоминания и т.п.), идут через эту очередь:
+    общее и поштучное по чатам ведро токенов, пауза по RetryAfter, повторы с
+    экспоненциальной задержкой. Пока сообщение не доставлено, оно лежит в таблице outbox
+    и после рестарта отправится снова.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        db: Database,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        workers: int = 8,
+        max_attempts: int = 6,
+    ):
+        self.bot = bot
+        self.db = db
+        self.per_chat_rate = per_chat_rate
+        self.workers = workers
+        self.max_attempts = max_attempts
+
+        self._global = TokenBucket(global_rate, capacity=GLOBAL_BURST)
+        self._chats: LRUCache[int, TokenBucket] = LRUCache(10_000)
+        self._paused_until = 0.0
+        # (время, chat_id) последних 429 — чтобы отличить флуд одного чата от общего
+        self._flood: deque[tuple[float, int]] = deque()
+        self._queue: asyncio.Queue[tuple[int, int, str, int]] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+        self.stats = {"sent": 0, "retry_after": 0, "global_pauses": 0, "retries": 0, "dropped": 0}
+
+    async def start(self) -> None:
+        """Поднимает воркеров и ставит в очередь всё, что не доставили до рестарта."""
+        pending = await self.db.fetchall("SELECT id, chat_id, text, attempts FROM outbox ORDER BY id")
+        for item in pending:
+            self._queue.put_nowait(item)
+        if pending:
+            logger.info("📬 В очереди после рестарта: %s сообщений", len(pending))
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def send(self, chat_id: int, text: str) -> None:
+        """Сохраняет сообщение и ставит его в очередь на отправку."""
+        msg_id = await self.db.run(store_message, chat_id, text)
+        self.enqueue(msg_id, chat_id, text)
+
+    def enqueue(self, msg_id: int, chat_id: int, text: str) -> None:
+        """
+        Ставит в очередь сообщение, уже записанное store_message() —
+        например, в одной транзакции с изменением, из-за которого его шлём.
+        """
+        self._queue.put_nowait((msg_id, chat_id, text, 0))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, capacity=1)
+            self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(*item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Ошибка очереди сообщений")
+            finally:
+                self._queue.task_done()
+
+    def _pause_left(self, chat: TokenBucket) -> float:
+        return max(self._paused_until, chat.blocked_until) - time.monotonic()
+
+    def _on_retry_after(self, chat_id: int, chat: TokenBucket, retry_after: float) -> None:
+        """429 закрывает только свой чат; 429 сразу в нескольких чатах — общий флуд, пауза для всех."""
+        now = time.monotonic()
+        chat.block(retry_after)
+        self._flood.append((now, chat_id))
+        while self._flood[0][0] < now - FLOOD_WINDOW:
+            self._flood.popleft()
+        if len({c for _, c in self._flood}) >= GLOBAL_FLOOD_CHATS:
+            self.stats["global_pauses"] += 1
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    async def _deliver(self, msg_id: int, chat_id: int, text: str, attempts: int) -> None:
+        chat = self._chat_bucket(chat_id)
+        while (pause := self._pause_left(chat)) > 0:
+            await asyncio.sleep(pause)
+        await chat.acquire()
+        await self._global.acquire()
+        # Пока ждали токены, могла начаться пауза
+        while (pause := self._pause_left(chat)) > 0:
+            await asyncio.sleep(pause)
+
+        try:
+            try:
+                await self.bot.send_message(chat_id, text)
+            finally:
+                chat.settle()
+        except TelegramRetryAfter as e:
+            # Флуд-контроль: притормаживаем чат (или всех) и повторяем это же сообщение
+            self.stats["retry_after"] += 1
+            self._on_retry_after(chat_id, chat, e.retry_after)
+            self._queue.put_nowait((msg_id, chat_id, text, attempts))
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат недоступен — повтор не поможет
+            self.stats["dropped"] += 1
+            logger.warning("⚠️ Сообщение для %s отброшено: %s", chat_id, e)
+            await self.db.execute("DELETE FROM outbox WHERE id=?", (msg_id,))
+            return
+        except (TelegramNetworkError, TelegramServerError) as e:
+            attempts += 1
+            await self.db.execute("UPDATE outbox SET attempts=? WHERE id=?", (attempts, msg_id))
+            if attempts >= self.max_attempts:
+                self.stats["dropped"] += 1
+                logger.error("❌ Не удалось доставить сообщение %s для %s: %s (останется в outbox)", msg_id, chat_id, e)
+                return
+            self.stats["retries"] += 1
+            asyncio.get_running_loop().call_later(
+                min(2 ** attempts, 300), self._queue.put_nowait, (msg_id, chat_id, text, attempts)
+            )
+            return
+
+        self.stats["sent"] += 1
+        await self.db.execute("DELETE FROM outbox WHERE id=?", (msg_id,))
+
+
+def store_message(con: sqlite3.Connection, chat_id: int, text: str) -> int:
+    """Записывает сообщение в outbox в транзакции con; отправит его Outbox.enqueue() или рестарт."""
+    return con.execute(
+        "INSERT INTO outbox (chat_id, text, attempts, created_at) VALUES (?, ?, 0, CURRENT_TIMESTAMP)",
+        (chat_id, text)
+    ).lastrowid
@@ -0,0 +1,205 @@
+"""Синхронизация локальной копии CSV с удалённым сервером по SFTP."""
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+import aiofiles
+import asyncssh
+
+# Сколько байт с конца локальной копии сверяем с сервером перед дозагрузкой хвоста
+PROBE_BYTES = 4096
+# Размер блока при чтении хвоста
+BLOCK_SIZE = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteConnection:
+    """
+    Одно долгоживущее SSH-подключение и SFTP-сессия на все импорты.
+    Держится keepalive'ами, при обрыве переподключается с экспоненциальной паузой.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        key: str,
+        port: int = 22,
+        keepalive_interval: float = 30,
+        attempts: int = 4,
+        max_backoff: float = 30,
+    ):
+        self.host = host
+        self.username = username
+        self.key = key
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        self.attempts = attempts
+        self.max_backoff = max_backoff
+
+        self._conn: asyncssh.SSHClientConnection | None = None
+        self._sftp: asyncssh.SFTPClient | None = None
+        self._lock = asyncio.Lock()
+
+        # ⏱ Для сравнения: сколько стоит handshake и сколько сама передача
+        self.stats = {
+            "connects": 0,
+            "connect_seconds": 0.0,
+            "last_connect_seconds": 0.0,
+            "transfers": 0,
+            "last_transfer_seconds": 0.0,
+        }
+
+    async def sftp(self) -> asyncssh.SFTPClient:
+        """Живая SFTP-сессия; подключается заново, если прошлая оборвалась."""
+        async with self._lock:
+            if self._sftp is not None and self._conn is not None and not self._conn.is_closed():
+                return self._sftp
+
+            await self._drop()
+
+            delay = 1.0
+            for attempt in range(1, self.attempts + 1):
+                started = time.perf_counter()
+                try:
+                    self._conn = await asyncssh.connect(
+                        self.host,
+                        self.port,
+                        username=self.username,
+                        client_keys=[self.key],
+                        known_hosts=None,
+                        keepalive_interval=self.keepalive_interval,
+                        keepalive_count_max=3,
+                    )
+                    self._sftp = await self._conn.start_sftp_client()
+                except (OSError, asyncssh.Error) as e:
+                    await self._drop()
+                    if attempt == self.attempts:
+                        raise
+                    logger.warning(
+                        "🔌 SSH подключение не удалось (%s/%s): %s — повтор через %.0f с",
+                        attempt, self.attempts, e, delay
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+                    continue
+
+                elapsed = time.perf_counter() - started
+                self.stats["connects"] += 1
+                self.stats["connect_seconds"] += elapsed
+                self.stats["last_connect_seconds"] = elapsed
+                logger.info("🔌 SSH подключение к %s за %.3f с", self.host, elapsed)
+                return self._sftp
+
+    async def sync(self, remote_path: str, local_path: Path) -> str:
+        """sync_remote_csv() поверх общего подключения."""
+        sftp = await self.sftp()
+        started = time.perf_counter()
+        try:
+            status = await sync_remote_csv(sftp, remote_path, local_path)
+        except (OSError, asyncssh.Error):
+            # Сессия могла умереть — в следующий раз подключимся заново
+            async with self._lock:
+                await self._drop()
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.stats["transfers"] += 1
+        self.stats["last_transfer_seconds"] = elapsed
+        logger.info(
+            "📡 CSV %s за %.3f с (handshake %.3f с, подключений всего %s)",
+            status, elapsed, self.stats["last_connect_seconds"], self.stats["connects"]
+        )
+        return status
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._drop()
+
+    async def _drop(self) -> None:
+        if self._sftp is not None:
+            self._sftp.exit()
+            self._sftp = None
+        if self._conn is not None:
+            self._conn.close()
+            await self._conn.wait_closed()
+            self._conn = None
+
+
+async def sync_remote_csv(sftp: asyncssh.SFTPClient, remote_path: str, local_path: Path) -> str:
+    """
+    Приводит local_path к состоянию remote_path с минимумом трафика.
+    Возвращает "unchanged" (ничего не качали), "appended" (докачан только хвост)
+    или "full" (файл скачан целиком).
+    """
+    attrs = await sftp.stat(remote_path)
+    size, mtime = attrs.size, attrs.mtime
+
+    local_size = local_path.stat().st_size if local_path.exists() else 0
+
+    # Размер и mtime (с точностью до секунды) совпали — но файл могли переписать
+    # той же длины в ту же секунду, поэтому сверяем ещё начало и конец
+    if (
+        local_size
+        and local_size == size
+        and int(local_path.stat().st_mtime) == mtime
+        and await _same_edges(sftp, remote_path, local_path, size)
+    ):
+        return "unchanged"
+
+    if 0 < local_size < size and await _append_tail(sftp, remote_path, local_path, local_size, size):
+        os.utime(local_path, (mtime, mtime))
+        return "appended"
+
+    # 📥 Полная загрузка во временный файл, чтобы импорт не увидел полфайла
+    tmp_path = local_path.with_name(local_path.name + ".part")
+    await sftp.get(remote_path, tmp_path, preserve=True)
+    os.replace(tmp_path, local_path)
+    return "full"
+
+
+async def _same_edges(sftp: asyncssh.SFTPClient, remote_path: str, local_path: Path, size: int) -> bool:
+    """Первые и последние PROBE_BYTES локальной копии совпадают с сервером."""
+    probe_len = min(PROBE_BYTES, size)
+    async with aiofiles.open(local_path, "rb") as f:
+        local_head = await f.read(probe_len)
+        await f.seek(size - probe_len)
+        local_tail = await f.read(probe_len)
+    async with sftp.open(remote_path, "rb") as rf:
+        return (
+            await rf.read(probe_len, 0) == local_head
+            and await rf.read(probe_len, size - probe_len) == local_tail
+        )
+
+
+async def _append_tail(
+    sftp: asyncssh.SFTPClient,
+    remote_path: str,
+    local_path: Path,
+    local_size: int,
+    size: int,
+) -> bool:
+    """Дописывает новые байты, если начало файла на сервере не поменялось."""
+    probe_len = min(PROBE_BYTES, local_size)
+
+    async with aiofiles.open(local_path, "rb") as f:
+        await f.seek(local_size - probe_len)
+        local_probe = await f.read(probe_len)
+
+    async with sftp.open(remote_path, "rb") as rf:
+        if await rf.read(probe_len, local_size - probe_len) != local_probe:
+            return False
+
+        async with aiofiles.open(local_path, "ab") as f:
+            pos = local_size
+            while pos < size:
+                block = await rf.read(min(BLOCK_SIZE, size - pos), pos)
+                if not block:
+                    break
+                await f.write(block)
+                pos += len(block)
+
+    return True
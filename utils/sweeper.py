@@ -0,0 +1,64 @@
+"""Один фоновый «подметальщик» сроков вместо отдельного таймера на каждую бронь."""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineSweeper:
+    """
+    Вызывает sweep() — пакетную обработку всего, что уже просрочено, — и спит
+    до ближайшего следующего срока, который sweep() возвращает сам (например,
+    MIN(...) по индексу в БД). Очередью сроков служит индекс, поэтому память
+    не растёт с числом броней; notify() будит раньше, если появился более ранний срок.
+    """
+
+    def __init__(self, sweep: Callable[[], Awaitable[datetime | None]], max_sleep: float = 3600, retry: float = 60):
+        self._sweep = sweep
+        self.max_sleep = max_sleep
+        self.retry = retry
+        self._next: datetime | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self, deadline: datetime) -> None:
+        """Сообщает о новом сроке; будит подметальщика, только если он раньше текущего."""
+        if self._next is None or deadline < self._next:
+            self._next = deadline
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                next_at = await self._sweep()
+            except Exception:
+                logger.exception("❌ Ошибка при обработке сроков")
+                next_at = datetime.now(timezone.utc) + timedelta(seconds=self.retry)
+
+            # Пока шла обработка, мог прийти более ранний срок — сразу ещё круг
+            if self._wakeup.is_set():
+                continue
+            self._next = next_at
+
+            delay = self.max_sleep
+            if next_at is not None:
+                delay = min(delay, max(0.0, (next_at - datetime.now(timezone.utc)).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
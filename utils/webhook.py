@@ -0,0 +1,161 @@
+"""Приём обновлений через вебхук на встроенном aiohttp-сервере."""
+import asyncio
+import hmac
+import logging
+import signal
+from collections import deque
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def chat_key(update: Update) -> int:
+    """Ключ очерёдности: чат (или пользователь) события; без них — само обновление."""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else -update.update_id
+
+
+class ChatOrderedPool:
+    """
+    Ограниченный пул обработчиков: до workers обновлений параллельно, но из
+    одного чата — строго по очереди (нажатия пользователя не обгоняют друг друга).
+    Не больше max_pending обновлений в работе и в очереди: submit() ждёт места.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Update], Awaitable[object]],
+        workers: int = 16,
+        max_pending: int = 1000,
+    ):
+        self.handle = handle
+        self.workers = workers
+
+        self._slots = asyncio.Semaphore(max_pending)
+        self._chats: dict[int, deque[Update]] = {}
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+        self.stats = {"received": 0, "processed": 0, "failed": 0}
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Дорабатывает принятые обновления и останавливает воркеров."""
+        await self._ready.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, update: Update) -> None:
+        await self._slots.acquire()
+        self.stats["received"] += 1
+        key = chat_key(update)
+        pending = self._chats.get(key)
+        if pending is not None:
+            # Чат уже в работе — воркер возьмёт это обновление следом
+            pending.append(update)
+            return
+        self._chats[key] = deque([update])
+        self._ready.put_nowait(key)
+
+    async def join(self) -> None:
+        await self._ready.join()
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            pending = self._chats[key]
+            try:
+                while pending:
+                    update = pending[0]
+                    try:
+                        await self.handle(update)
+                        self.stats["processed"] += 1
+                    except Exception:
+                        self.stats["failed"] += 1
+                        logger.exception("❌ Ошибка обработки обновления %s", update.update_id)
+                    finally:
+                        pending.popleft()
+                        self._slots.release()
+            finally:
+                del self._chats[key]
+                self._ready.task_done()
+
+
+def build_webhook_app(
+    bot: Bot,
+    pool: ChatOrderedPool,
+    path: str,
+    secret: str | None = None,
+) -> web.Application:
+    """aiohttp-приложение: проверяет секрет, ставит обновление в пул и сразу отвечает 200."""
+
+    async def receive(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except ValueError:
+            return web.Response(status=400)
+        await pool.submit(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    host: str,
+    port: int,
+    path: str,
+    secret: str | None = None,
+    workers: int = 16,
+    max_pending: int = 1000,
+) -> None:
+    """Регистрирует вебхук в Telegram и обслуживает его до SIGINT/SIGTERM."""
+    if not url:
+        raise ValueError("webhook url is required: set_webhook('') would remove the webhook")
+    pool = ChatOrderedPool(lambda update: dp.feed_update(bot, update), workers, max_pending)
+    runner = web.AppRunner(build_webhook_app(bot, pool, path, secret), access_log=None)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    await pool.start()
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+    logger.info("🌐 Вебхук %s, слушаем %s:%s%s", url, host, port, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await pool.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        await bot.session.close()